@@ -0,0 +1,283 @@
+import os
+import re
+import json
+import sqlite3
+import threading
+import subprocess
+import numpy as np
+from datetime import datetime
+
+
+
+class ArchiveIndex:
+    """Indice temporale persistente (SQLite) dell'archivio registrato.
+
+    Ogni riga e' un segmento audio: intervallo assoluto [start_ts, end_ts) in
+    secondi epoch, file, posizione del segmento nel file, frequenza e tipo
+    (group, hls, ogg). I gruppi hanno una riga per blocco: i blocchi sono i punti
+    di ricerca, ancorati all'ora reale del loro primo campione. Le query su un
+    intervallo di tempo decodificano con ffmpeg (-ss/-t) solo i segmenti coinvolti.
+
+    start_sample e' l'offset nel file in campioni a sample_rate; byte_offset e'
+    NULL quando il container compresso non da' una posizione in byte;
+    capture_sample e' il contatore di cattura del primo campione (NULL per i file
+    importati da scanArchive)."""
+
+    dbPath:str
+    lock:threading.Lock
+    connection:sqlite3.Connection
+
+    # Ordine di preferenza quando piu' segmenti coprono lo stesso istante
+    KindPriority = ("group", "ogg", "hls")
+
+    GroupPattern = re.compile(r"^group_(\d{8}_\d{6})\.m4a$")
+    OggPattern = re.compile(r"^(\d{4}-\d{2}-\d{2}_\d{2}-\d{2}-\d{2})\.ogg$")
+
+    # Gli indici scritti senza capture_sample vengono convertiti da migrateSegments
+    SegmentsTable = """
+        CREATE TABLE IF NOT EXISTS {name} (
+            id INTEGER PRIMARY KEY,
+            start_ts REAL NOT NULL,
+            end_ts REAL NOT NULL,
+            path TEXT NOT NULL,
+            byte_offset INTEGER,
+            start_sample INTEGER NOT NULL DEFAULT 0,
+            capture_sample INTEGER,
+            sample_rate INTEGER NOT NULL,
+            kind TEXT NOT NULL,
+            UNIQUE (path, start_sample)
+        )"""
+
+
+
+    def __init__(self, dbPath:str):
+        self.dbPath = dbPath
+        self.lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(dbPath)), exist_ok=True)
+        # Una sola connessione condivisa tra i thread del recorder, serializzata dal lock
+        self.connection = sqlite3.connect(dbPath, check_same_thread=False)
+        with self.lock, self.connection:
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            columns = [row[1] for row in self.connection.execute("PRAGMA table_info(segments)")]
+            if columns and "capture_sample" not in columns:
+                self.migrateSegments()
+            self.connection.execute(self.SegmentsTable.format(name="segments"))
+            self.connection.execute("CREATE INDEX IF NOT EXISTS segments_time ON segments (start_ts, end_ts)")
+
+
+
+    def migrateSegments(self):
+        """Indici scritti prima di capture_sample: start_sample conteneva il contatore di cattura
+        e ogni riga copriva il file intero, quindi l'offset nel file era 0"""
+        print("[Index] Aggiornamento dello schema: contatore di cattura in capture_sample")
+        self.connection.execute(self.SegmentsTable.format(name="segments_v2"))
+        self.connection.execute(
+            "INSERT INTO segments_v2 (start_ts, end_ts, path, byte_offset, start_sample, capture_sample, sample_rate, kind) "
+            "SELECT start_ts, end_ts, path, byte_offset, 0, NULLIF(start_sample, 0), sample_rate, kind FROM segments")
+        self.connection.execute("DROP TABLE segments")
+        self.connection.execute("ALTER TABLE segments_v2 RENAME TO segments")
+
+
+
+    def addSegment(self, path:str, startTime, duration:float, sampleRate:int, kind:str, byteOffset:int=0, startSample:int=0,
+                   captureSample:int=None):
+        """Registra (o aggiorna) un segmento; startTime e' datetime o secondi epoch.
+
+        startSample/byteOffset: posizione nel file (byteOffset None se non nota),
+        captureSample: contatore di cattura del primo campione."""
+        start = startTime.timestamp() if isinstance(startTime, datetime) else float(startTime)
+        with self.lock, self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO segments (start_ts, end_ts, path, byte_offset, start_sample, capture_sample, sample_rate, kind) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (start, start + duration, os.path.abspath(path), byteOffset, startSample, captureSample, sampleRate, kind))
+
+
+
+    def query(self, start, end, kinds=None):
+        """Segmenti che intersecano [start, end), in ordine di preferenza e di tempo"""
+        start = start.timestamp() if isinstance(start, datetime) else float(start)
+        end = end.timestamp() if isinstance(end, datetime) else float(end)
+        kinds = kinds or self.KindPriority
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT start_ts, end_ts, path, byte_offset, start_sample, capture_sample, sample_rate, kind FROM segments "
+                f"WHERE start_ts < ? AND end_ts > ? AND kind IN ({','.join('?' * len(kinds))}) ORDER BY start_ts",
+                (end, start, *kinds)).fetchall()
+        segments = [dict(zip(("start", "end", "path", "byteOffset", "startSample", "captureSample", "sampleRate", "kind"), row)) for row in rows]
+        segments.sort(key=lambda s: (kinds.index(s["kind"]), s["start"]))
+        return segments
+
+
+
+    def decode(self, path:str, offset:float, duration:float, sampleRate:int):
+        """PCM float32 mono di [offset, offset + duration) del file, alla frequenza richiesta"""
+        cmd = [
+            "ffmpeg", "-nostdin", "-loglevel", "error",
+            "-ss", f"{offset:.6f}",
+            "-t", f"{duration:.6f}",
+            "-i", path,
+            "-f", "f32le", "-ac", "1", "-ar", str(sampleRate),
+            "pipe:1"
+        ]
+        result = subprocess.run(cmd, capture_output=True)
+        if result.returncode != 0:
+            raise RuntimeError(f"ffmpeg exit code {result.returncode} decoding {path}: {result.stderr.decode(errors='replace').strip()}")
+        return np.frombuffer(result.stdout, dtype=np.float32)
+
+
+
+    def extract(self, start, end, sampleRate:int=16000, outputPath:str=None, kinds=None):
+        """Audio esatto di [start, end): i tratti non registrati (o file non piu' presenti) restano a zero.
+
+        Con outputPath il clip viene anche scritto su file (formato dall'estensione)."""
+        start = start.timestamp() if isinstance(start, datetime) else float(start)
+        end = end.timestamp() if isinstance(end, datetime) else float(end)
+        total = int(round((end - start) * sampleRate))
+        pcm = np.zeros(total, dtype=np.float32)
+        covered = np.zeros(total, dtype=bool)
+
+        for segment in self.query(start, end, kinds):
+            first = max(start, segment["start"])
+            last = min(end, segment["end"])
+            a = int(round((first - start) * sampleRate))
+            b = min(total, int(round((last - start) * sampleRate)))
+            if b <= a or covered[a:b].all():
+                continue
+            if not os.path.exists(segment["path"]):
+                print(f"[Index] File non piu' presente: {segment['path']}")
+                continue
+
+            # Ricerca dal punto del segmento nel file, non dall'inizio: i blocchi dei gruppi hanno ciascuno la propria ora
+            offset = segment["startSample"] / segment["sampleRate"] + first - segment["start"]
+            data = self.decode(segment["path"], offset, last - first, sampleRate)[:b - a]
+            free = ~covered[a:a + len(data)]
+            pcm[a:a + len(data)][free] = data[free]
+            covered[a:a + len(data)] = True
+
+        if outputPath:
+            self.writeClip(pcm, sampleRate, outputPath)
+        return pcm
+
+
+
+    def writeClip(self, pcm:np.ndarray, sampleRate:int, outputPath:str):
+        cmd = [
+            "ffmpeg", "-y", "-nostdin", "-loglevel", "error",
+            "-f", "f32le", "-ar", str(sampleRate), "-ac", "1",
+            "-i", "pipe:0",
+            outputPath
+        ]
+        result = subprocess.run(cmd, input=pcm.tobytes(), capture_output=True)
+        if result.returncode != 0:
+            raise RuntimeError(f"ffmpeg exit code {result.returncode} writing {outputPath}: {result.stderr.decode(errors='replace').strip()}")
+
+
+
+    def prune(self):
+        """Elimina le righe dei file non piu' presenti (es. cartelle gia' caricate nel cloud)"""
+        with self.lock:
+            paths = [row[0] for row in self.connection.execute("SELECT DISTINCT path FROM segments")]
+        missing = [(p,) for p in paths if not os.path.exists(p)]
+        with self.lock, self.connection:
+            self.connection.executemany("DELETE FROM segments WHERE path = ?", missing)
+        return len(missing)
+
+
+
+    def probe(self, path:str):
+        """(durata, frequenza) di un file audio"""
+        cmd = [
+            "ffprobe", "-v", "error", "-select_streams", "a:0",
+            "-show_entries", "stream=sample_rate:format=duration",
+            "-of", "json", path
+        ]
+        result = subprocess.run(cmd, capture_output=True, text=True)
+        if result.returncode != 0:
+            raise RuntimeError(f"ffprobe exit code {result.returncode} on {path}: {result.stderr.strip()}")
+        info = json.loads(result.stdout)
+        return float(info["format"]["duration"]), int(info["streams"][0]["sample_rate"])
+
+
+
+    def scanArchive(self, processedDir:str=None, oggDir:str=None):
+        """Indicizza un archivio esistente dai nomi dei file: gruppi m4a e playlist HLS
+        in processedDir (YYYYMMDD/), ogg di recorder.py in oggDir. Una tantum, per i dati
+        registrati prima dell'indice; i file gia' indicizzati vengono saltati."""
+        with self.lock:
+            known = {row[0] for row in self.connection.execute("SELECT DISTINCT path FROM segments")}
+        added = 0
+
+        for root in (processedDir, oggDir):
+            if not root or not os.path.isdir(root):
+                continue
+            for day in sorted(os.listdir(root)):
+                dayFolder = os.path.join(root, day)
+                if not (day.isdigit() and len(day) == 8 and os.path.isdir(dayFolder)):
+                    continue
+                for name in sorted(os.listdir(dayFolder)):
+                    path = os.path.abspath(os.path.join(dayFolder, name))
+                    group = self.GroupPattern.match(name)
+                    ogg = self.OggPattern.match(name)
+                    if name == f"{day}.m3u8":
+                        added += self.scanPlaylist(path, known)
+                    elif (group or ogg) and path not in known:
+                        try:
+                            duration, rate = self.probe(path)
+                        except Exception as e:
+                            print(f"[Index] {e}")
+                            continue
+                        if group:
+                            self.addSegment(path, datetime.strptime(group.group(1), "%Y%m%d_%H%M%S"), duration, rate, "group")
+                        else:
+                            self.addSegment(path, datetime.strptime(ogg.group(1), "%Y-%m-%d_%H-%M-%S"), duration, rate, "ogg")
+                        added += 1
+
+        self.prune()
+        return added
+
+
+
+    def scanPlaylist(self, playlistPath:str, known:set=()):
+        """Segmenti di una playlist HLS con EXT-X-PROGRAM-DATE-TIME (quelli senza data sono ignorati)"""
+        folder = os.path.dirname(playlistPath)
+        added = 0
+        dateTime = None
+        duration = None
+        with open(playlistPath, "r", encoding="utf-8") as f:
+            for line in (line.strip() for line in f):
+                if line.startswith("#EXT-X-PROGRAM-DATE-TIME:"):
+                    dateTime = datetime.fromisoformat(line.split(":", 1)[1])
+                elif line.startswith("#EXTINF:"):
+                    duration = float(line[len("#EXTINF:"):].rstrip(","))
+                elif line and not line.startswith("#"):
+                    path = os.path.abspath(os.path.join(folder, line))
+                    if dateTime is not None and duration is not None and path not in known and os.path.exists(path):
+                        _, rate = self.probe(path)
+                        self.addSegment(path, dateTime, duration, rate, "hls")
+                        added += 1
+                    dateTime = None
+        return added
+
+
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+
+
+if __name__ == "__main__":
+    import sys
+
+    # python archiveIndex.py scan <processed_audio> [<audio ogg>]
+    # python archiveIndex.py extract 2024-05-01T14:37:00 2024-05-01T14:38:00 clip.wav
+    index = ArchiveIndex(os.path.join("processed_audio", "archive.sqlite"))
+    if sys.argv[1] == "scan":
+        print(f"{index.scanArchive(sys.argv[2], sys.argv[3] if len(sys.argv) > 3 else None)} segmenti indicizzati")
+    elif sys.argv[1] == "extract":
+        start = datetime.fromisoformat(sys.argv[2])
+        end = datetime.fromisoformat(sys.argv[3])
+        index.extract(start, end, outputPath=sys.argv[4])
+        print(f"Clip {sys.argv[4]} salvato")
+    index.close()
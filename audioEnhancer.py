@@ -0,0 +1,103 @@
+import time
+import numpy as np
+import noisereduce as nr
+from pedalboard import *
+
+from noiseReducer import StreamingNoiseReducer
+
+
+
+class AudioEnhancer:
+    """Amplificazione, riduzione rumore ed equalizzazione voce di un blocco audio.
+
+    Con streaming=True lo stato (inviluppi, filtri, profilo del rumore) prosegue
+    da un blocco al successivo; con streaming=False ogni blocco e' elaborato da
+    solo, in modo deterministico, come fa i2sRecorder sia in seriale che nei
+    worker del pool di processi."""
+
+    sampleRate:int
+    amplifyFactor:float
+    blockSize:int
+    streaming:bool
+    noiseReductionMode:str
+    noiseReductionDecrease:float
+
+    amplifyBuffer:np.ndarray
+    enhanceBoard:Pedalboard
+    noiseReducer:StreamingNoiseReducer = None
+    lastTimings:dict
+
+
+
+    def __init__(self, sampleRate:int, trackFrames:int, amplifyDb:float=40, blockSize:int=8192, streaming:bool=True,
+                 noiseReductionMode:str="streaming", noiseReductionQuality:str="medium", noiseReductionDecrease:float=0.60):
+        self.sampleRate = sampleRate
+        self.amplifyFactor = 10 ** (amplifyDb / 20)
+        self.blockSize = blockSize
+        self.streaming = streaming
+        self.noiseReductionMode = noiseReductionMode
+        self.noiseReductionDecrease = noiseReductionDecrease
+
+        self.enhanceBoard = Pedalboard([
+            NoiseGate(threshold_db=-35, ratio=2.0, release_ms=200), # Soglia più bassa, rapporto più deciso, rilascio più rapido
+            Compressor(threshold_db=-20, ratio=3.0, attack_ms=5, release_ms=100), # Parametri più reattivi per la voce
+            LowShelfFilter(cutoff_frequency_hz=350, gain_db=-6, q=0.707), # Taglia le basse-medie problematiche (-6dB è un taglio significativo)
+            HighShelfFilter(cutoff_frequency_hz=3000, gain_db=5, q=0.707), # Boost significativo sopra i 3kHz per chiarezza e "aria"
+            Gain(gain_db=5) # Aggiusta questo per il volume desiderato
+        ])
+        self.amplifyBuffer = np.empty(trackFrames, dtype=np.float32)
+        # Secondi spesi da riduzione rumore e Pedalboard nell'ultimo process(), letti dalle metriche
+        self.lastTimings = {"noise_reduction": 0.0, "pedalboard": 0.0}
+
+        if noiseReductionMode == "streaming":
+            self.noiseReducer = StreamingNoiseReducer(
+                sampleRate,
+                quality=noiseReductionQuality,
+                propDecrease=noiseReductionDecrease)
+
+
+
+    @property
+    def latency(self):
+        """Campioni di ritardo dell'uscita rispetto all'ingresso (solo la riduzione rumore in streaming)"""
+        if self.streaming and self.noiseReducer is not None:
+            return self.noiseReducer.latency
+        return 0
+
+
+
+    def flush(self):
+        """Restituisce gli ultimi `latency` campioni ancora trattenuti e riparte da uno stato vuoto.
+
+        Il profilo del rumore appreso resta: si azzerano solo buffer STFT e inviluppi."""
+        tail = np.zeros(0, dtype=np.float32)
+        if self.latency:
+            reduced = self.noiseReducer.process(np.zeros(self.latency, dtype=np.float32))
+            tail = self.enhanceBoard.process(reduced, self.sampleRate, buffer_size=self.blockSize, reset=False)
+            self.noiseReducer.reset()
+        self.enhanceBoard.reset()
+        return tail
+
+
+
+    def process(self, data:np.ndarray):
+        # Il guadagno e' lineare e senza stato: moltiplicazione in place nel buffer preallocato
+        if len(data) != len(self.amplifyBuffer):
+            self.amplifyBuffer = np.empty(len(data), dtype=np.float32)
+        amplified = np.multiply(data, self.amplifyFactor, out=self.amplifyBuffer, casting='unsafe')
+
+        started = time.perf_counter()
+        if self.noiseReducer is None:
+            reduced_noise = nr.reduce_noise(y=amplified, sr=self.sampleRate, stationary=False, prop_decrease=self.noiseReductionDecrease)
+        elif self.streaming:
+            reduced_noise = self.noiseReducer.process(amplified)
+        else:
+            reduced_noise = self.noiseReducer.processIsolated(amplified)
+
+        reduced = time.perf_counter()
+
+        # In streaming (reset=False) gli inviluppi di NoiseGate/Compressor non ripartono ad ogni blocco
+        enhanced = self.enhanceBoard.process(reduced_noise, self.sampleRate, buffer_size=self.blockSize, reset=not self.streaming)
+        self.lastTimings["noise_reduction"] = reduced - started
+        self.lastTimings["pedalboard"] = time.perf_counter() - reduced
+        return enhanced
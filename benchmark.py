@@ -0,0 +1,411 @@
+import os
+import io
+import sys
+import json
+import time
+import platform
+import resource
+import tempfile
+import contextlib
+import subprocess
+import tracemalloc
+import numpy as np
+from datetime import datetime
+
+from streamEncoder import StreamEncoder
+from encoderPresets import EncoderPresets
+from streamResampler import StreamResampler
+from audioEnhancer import AudioEnhancer
+from dash_processor import DashProcessor
+
+# Ora di inizio della sorgente sintetica: un giorno passato, cosi' DashProcessor lo considera chiuso
+BenchStartTime = datetime(2024, 1, 1, 8, 0, 0).timestamp()
+
+
+
+def syntheticVoice(seconds:float, sampleRate:int, seed:int=0):
+    """Segnale simil-parlato (armoniche modulate a sillabe, con pause) sopra rumore di fondo"""
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * sampleRate)) / sampleRate
+    pitch = 140 + 30 * np.sin(2 * np.pi * 0.3 * t)
+    phase = 2 * np.pi * np.cumsum(pitch) / sampleRate
+    voice = sum(np.sin(k * phase) / k for k in range(1, 8))
+    syllables = np.clip(np.sin(2 * np.pi * 4 * t), 0, None) * (np.sin(2 * np.pi * 0.2 * t) > -0.3)
+    noise = rng.normal(0, 0.01, len(t))
+    return (0.05 * voice * syllables + noise).astype(np.float32)
+
+
+
+class FakeI2sDevice:
+    """Sorgente sintetica con l'interfaccia di i2sDevice usata dal recorder.
+
+    Restituisce parlato simulato sopra rumore (un blocco su tre solo rumore, come
+    una stanza vuota) piu' veloce del tempo reale, con un orologio di cattura
+    che parte da startTime e non deriva."""
+
+    deviceReady:bool = True
+    deviceSampleRate:int
+    startTime:float
+    blocks:list
+
+    capturedSamples:int = 0
+    captureCount:int = 0
+    lastCaptureTime:float = None
+    lastCaptureSample:int = 0
+
+
+
+    def __init__(self, sampleRate:int, startTime:float=BenchStartTime, blockSeconds:int=30, seed:int=0):
+        self.deviceSampleRate = sampleRate
+        self.startTime = startTime
+        rng = np.random.default_rng(seed)
+        noise = rng.normal(0, 0.01, blockSeconds * sampleRate).astype(np.float32)
+        self.blocks = [syntheticVoice(blockSeconds, sampleRate, seed), syntheticVoice(blockSeconds, sampleRate, seed + 1), noise]
+
+
+
+    def startStream(self, bufferSeconds:int=120, blocksize:int=0):
+        pass
+
+
+
+    def stopStream(self):
+        pass
+
+
+
+    def clockDrift(self):
+        return 0.0, 0.0
+
+
+
+    def streamStats(self):
+        return {
+            "clockDriftSeconds": 0.0,
+            "clockDriftPpm": 0.0,
+            "overflows": 0,
+            "droppedFrames": 0,
+            "capturedFrames": self.capturedSamples,
+            "readFrames": self.capturedSamples,
+            "bufferedFrames": 0,
+            "callbacks": self.captureCount,
+        }
+
+
+
+    def captureStream(self, duration:int):
+        frames = int(duration * self.deviceSampleRate)
+        block = self.blocks[self.captureCount % len(self.blocks)]
+        audio = np.resize(block, frames)
+        self.lastCaptureTime = self.startTime + self.capturedSamples / self.deviceSampleRate
+        self.lastCaptureSample = self.capturedSamples
+        self.capturedSamples += frames
+        self.captureCount += 1
+        return audio
+
+
+
+def folderBytes(path:str):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            total += os.path.getsize(os.path.join(root, name))
+    return total
+
+
+
+def childrenCpu():
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+
+def stageRows(stages:dict, seconds:float, peakBytes:int, diskBytes:int, totalStages=None):
+    """Una riga per stadio (CPU, real-time factor) piu' la riga dei totali con memoria e disco.
+
+    totalStages limita il totale agli stadi della pipeline effettiva (se altri sono alternative)."""
+    rows = []
+    for stage, cpu in stages.items():
+        rows.append({
+            "stage": stage,
+            "cpu_s": round(cpu, 3),
+            "realtime_factor": round(seconds / cpu, 1) if cpu > 0 else None,
+            "peak_mb": None,
+            "disk_bytes": None,
+        })
+    total = sum(cpu for stage, cpu in stages.items() if totalStages is None or stage in totalStages)
+    rows.append({
+        "stage": "total",
+        "cpu_s": round(total, 3),
+        "realtime_factor": round(seconds / total, 1) if total > 0 else None,
+        "peak_mb": round(peakBytes / 1e6, 1),
+        "disk_bytes": diskBytes,
+    })
+    return rows
+
+
+
+def benchmarkEnhancer(seconds:float=120, sampleRate:int=48000, blockSeconds:int=30):
+    """CPU dei singoli passi di AudioEnhancer: amplificazione, riduzione rumore (streaming e noisereduce), Pedalboard"""
+    audio = syntheticVoice(seconds, sampleRate)
+    blockFrames = blockSeconds * sampleRate
+    streaming = AudioEnhancer(sampleRate=sampleRate, trackFrames=blockFrames)
+    batch = AudioEnhancer(sampleRate=sampleRate, trackFrames=blockFrames, noiseReductionMode="noisereduce")
+    stages = dict.fromkeys(("amplify", "noise_reduction_streaming", "noise_reduction_noisereduce", "pedalboard"), 0.0)
+
+    tracemalloc.start()
+    for start in range(0, len(audio), blockFrames):
+        block = audio[start:start + blockFrames]
+        t0 = time.process_time()
+        amplified = np.multiply(block, streaming.amplifyFactor, out=streaming.amplifyBuffer[:len(block)], casting='unsafe')
+        t1 = time.process_time()
+        reduced = streaming.noiseReducer.process(amplified)
+        t2 = time.process_time()
+        batch.process(block)
+        t3 = time.process_time()
+        streaming.enhanceBoard.process(reduced, sampleRate, buffer_size=streaming.blockSize, reset=False)
+        t4 = time.process_time()
+        stages["amplify"] += t1 - t0
+        stages["noise_reduction_streaming"] += t2 - t1
+        stages["noise_reduction_noisereduce"] += t3 - t2
+        stages["pedalboard"] += t4 - t3
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    # batch.process comprende anche amplificazione e Pedalboard: resta solo la riduzione rumore
+    stages["noise_reduction_noisereduce"] -= stages["amplify"] + stages["pedalboard"]
+    return stageRows(stages, seconds, peak, 0, totalStages=("amplify", "noise_reduction_streaming", "pedalboard"))
+
+
+
+def benchmarkRecorder(seconds:float=1200, processingRate:int=48000, preset:str="aac-128k", inMemory:bool=True):
+    """Pipeline di i2sRecorder su FakeI2sDevice: cattura, scrittura/journal, VAD, enhancement, encoder e packaging"""
+    from i2sRecorder import i2sRecorder
+
+    with tempfile.TemporaryDirectory() as tmp:
+        Recorder = type("BenchRecorder", (i2sRecorder,), {
+            "AudioTracksDir": os.path.join(tmp, "audio_logs"),
+            "ProcessedDir": os.path.join(tmp, "processed_audio"),
+            "SpillDir": os.path.join(tmp, "spill"),
+            "ProcessingRate": processingRate,
+            "EncoderPreset": preset,
+            "InMemoryPipeline": inMemory,
+            "FileBlocks": [],
+        })
+        stages = dict.fromkeys(("capture", "store", "vad", "enhance", "encode_package"), 0.0)
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            recorder = Recorder(device=FakeI2sDevice(Recorder.FrameRate))
+            children = childrenCpu()
+            tracemalloc.start()
+            for _ in range(int(seconds // recorder.SingleTrackDuration)):
+                t0 = time.process_time()
+                entry = recorder.captureEntry()
+                t1 = time.process_time()
+                item = recorder.storeTrack(entry)
+                t2 = time.process_time()
+                data = recorder.loadTrack(item)
+                silent = recorder.isSilent(item, data)
+                t3 = time.process_time()
+                enhanced = recorder.silentAudio(data) if silent else recorder.enhancedAudio(data)
+                t4 = time.process_time()
+                recorder.appendBlock(enhanced, item)
+                t5 = time.process_time()
+                stages["capture"] += t1 - t0
+                stages["store"] += t2 - t1
+                stages["vad"] += t3 - t2
+                stages["enhance"] += t4 - t3
+                stages["encode_package"] += t5 - t4
+            if recorder.GroupEncoder is not None:
+                t0 = time.process_time()
+                recorder.closeGroup()
+                stages["encode_package"] += time.process_time() - t0
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            ffmpegCpu = childrenCpu() - children
+
+        stages["ffmpeg"] = ffmpegCpu
+        return stageRows(stages, seconds, peak, folderBytes(tmp))
+
+
+
+def benchmarkJoin(seconds:float=600):
+    """recorder.py: scrittura dei chunk WAV e unione in OGG/Vorbis"""
+    import recorder
+
+    with tempfile.TemporaryDirectory() as tmp:
+        recorder.config.update(chunk_folder=os.path.join(tmp, "chunks") + "/", dest_folder=os.path.join(tmp, "audio") + "/")
+        recorder.logger.remove()
+        device = FakeI2sDevice(recorder.config["freq"], blockSeconds=recorder.config["chunk_duration"])
+        stages = dict.fromkeys(("write_chunk", "join_ogg"), 0.0)
+
+        tracemalloc.start()
+        for _ in range(int(seconds // recorder.config["chunk_duration"])):
+            audio = device.captureStream(recorder.config["chunk_duration"])
+            chunk = {
+                "init": datetime.fromtimestamp(device.lastCaptureTime).strftime("%Y%m%d%H%M%S"),
+                "data": (audio * 32767).astype(recorder.config["dtype"]),
+            }
+            t0 = time.process_time()
+            recorder._writeChunk(chunk)
+            stages["write_chunk"] += time.process_time() - t0
+
+        t0 = time.process_time()
+        job = recorder._nextJoin()
+        while job is not None:
+            cdir, files = job
+            if files:
+                recorder._joinChunks(recorder.config["chunk_folder"] + cdir, files)
+            job = recorder._nextJoin()
+        stages["join_ogg"] += time.process_time() - t0
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        return stageRows(stages, seconds, peak, folderBytes(tmp))
+
+
+
+def benchmarkDash(seconds:float=1200, sampleRate:int=48000, groupSeconds:int=600):
+    """DashProcessor su una giornata di gruppi m4a sintetici, in un passaggio e con merge intermedio"""
+    audio = syntheticVoice(groupSeconds, sampleRate)
+    results = []
+    for singlePass in (True, False):
+        with tempfile.TemporaryDirectory() as tmp:
+            day = datetime.fromtimestamp(BenchStartTime)
+            dayFolder = os.path.join(tmp, "processed_audio", day.strftime("%Y%m%d"))
+            os.makedirs(dayFolder)
+            for group in range(int(seconds // groupSeconds)):
+                groupTime = datetime.fromtimestamp(BenchStartTime + group * groupSeconds)
+                encoder = StreamEncoder(os.path.join(dayFolder, f"group_{groupTime.strftime('%Y%m%d_%H%M%S')}.m4a"), sampleRate).open()
+                encoder.write(audio)
+                encoder.close()
+
+            processor = DashProcessor(tmp, single_pass=singlePass)
+            children = childrenCpu()
+            with contextlib.redirect_stdout(io.StringIO()):
+                report = processor.process_folder(dayFolder)
+            ffmpegCpu = childrenCpu() - children
+            results.append({
+                "mode": report["mode"],
+                "wall_seconds": report["wall_seconds"],
+                "ffmpeg_cpu_s": round(ffmpegCpu, 3),
+                "realtime_factor": round(seconds / ffmpegCpu, 1) if ffmpegCpu > 0 else None,
+                "bytes_written": report["bytes_written"],
+                "archive_bytes": folderBytes(processor.archive_dir),
+            })
+    return results
+
+
+
+def benchmarkEncoders(seconds:float=120, sampleRate:int=48000, blockSeconds:int=30):
+    """CPU-secondi e byte per ora registrata di ogni preset, misurati sul processo ffmpeg"""
+    audio = syntheticVoice(seconds, sampleRate)
+    blockFrames = blockSeconds * sampleRate
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, preset in EncoderPresets.items():
+            outputPath = os.path.join(tmp, f"{name}.{preset['extension']}")
+            started = time.monotonic()
+            encoder = StreamEncoder(outputPath, sampleRate, preset=name).open()
+            for start in range(0, len(audio), blockFrames):
+                encoder.write(audio[start:start + blockFrames])
+            encoder.close()
+            hours = seconds / 3600
+            results.append({
+                "preset": name,
+                "cpu_seconds_per_hour": round(encoder.cpuSeconds / hours, 1),
+                "bytes_per_hour": int(os.path.getsize(outputPath) / hours),
+                "wall_seconds": round(time.monotonic() - started, 3),
+            })
+    return results
+
+
+
+def benchmarkResampling(seconds:float=120, captureRate:int=48000, processingRates=(48000, 24000, 16000), blockSeconds:int=30):
+    """Tempo CPU di ricampionamento + enhancement per secondo di audio, alle varie frequenze di elaborazione"""
+    audio = syntheticVoice(seconds, captureRate)
+    blockFrames = blockSeconds * captureRate
+    results = []
+    for rate in processingRates:
+        resampler = StreamResampler(captureRate, rate) if rate != captureRate else None
+        enhancer = AudioEnhancer(sampleRate=rate, trackFrames=blockSeconds * rate)
+        resampleCpu = 0.0
+        enhanceCpu = 0.0
+        for start in range(0, len(audio), blockFrames):
+            block = audio[start:start + blockFrames]
+            t0 = time.process_time()
+            if resampler is not None:
+                block = resampler.process(block)
+            t1 = time.process_time()
+            enhancer.process(block)
+            t2 = time.process_time()
+            resampleCpu += t1 - t0
+            enhanceCpu += t2 - t1
+        results.append({
+            "processing_rate": rate,
+            "resample_cpu_s": round(resampleCpu, 3),
+            "enhance_cpu_s": round(enhanceCpu, 3),
+            "realtime_factor": round(seconds / (resampleCpu + enhanceCpu), 1),
+        })
+    base = results[0]["resample_cpu_s"] + results[0]["enhance_cpu_s"]
+    for row in results:
+        row["speedup"] = round(base / (row["resample_cpu_s"] + row["enhance_cpu_s"]), 2)
+    return results
+
+
+
+def printTable(results:list):
+    if not results:
+        return
+    keys = list(results[0].keys())
+    print("  ".join(f"{k:>22}" for k in keys))
+    for row in results:
+        print("  ".join(f"{str(row[k]):>22}" for k in keys))
+
+
+
+def runInfo():
+    """Versione del codice e macchina, per confrontare risultati di run diversi"""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = None
+    return {
+        "commit": commit,
+        "date": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "cpus": os.cpu_count(),
+    }
+
+
+
+if __name__ == "__main__":
+    # python benchmark.py [nome ...] [--json=bench_results.json]
+    benchmarks = {
+        "encoders": benchmarkEncoders,
+        "resampling": benchmarkResampling,
+        "enhancer": benchmarkEnhancer,
+        "recorder": benchmarkRecorder,
+        "join": benchmarkJoin,
+        "dash": benchmarkDash,
+    }
+    names = [arg for arg in sys.argv[1:] if not arg.startswith("--")]
+    jsonPath = next((arg.split("=", 1)[1] for arg in sys.argv[1:] if arg.startswith("--json=")), "bench_results.json")
+
+    report = {"run": runInfo(), "results": {}}
+    for name in names or benchmarks.keys():
+        print(f"== {name} ==")
+        try:
+            report["results"][name] = benchmarks[name]()
+        except Exception as e:
+            # Un benchmark che non puo' girare (es. PortAudio assente) non blocca gli altri
+            print(f"{name} non eseguito: {e}")
+            report["results"][name] = {"error": str(e)}
+            continue
+        printTable(report["results"][name])
+
+    with open(jsonPath, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=1)
+    print(f"Risultati salvati in {jsonPath}")
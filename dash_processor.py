@@ -1,13 +1,23 @@
 import os
+import json
+import time
+import threading
 import subprocess
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
 class DashProcessor:
-    def __init__(self, base_dir, processed_folder="processed_audio", archive_folder="archive", segment_duration=600):
+    def __init__(self, base_dir, processed_folder="processed_audio", archive_folder="archive", segment_duration=600, single_pass=True,
+                 workers=1, io_slots=1):
         # base_dir: cartella dove si trova lo script
         self.processed_dir = os.path.join(base_dir, processed_folder)
         self.archive_dir = os.path.join(base_dir, archive_folder)
         self.segment_duration = segment_duration  # durata segmento in secondi (es: 600 = 10 minuti)
+        # single_pass: DASH generato direttamente dalla lista dei gruppi, senza merged.m4a intermedio
+        self.single_pass = single_pass
+        # workers: cartelle (giorni) elaborate in parallelo; io_slots: quante possono usare il disco insieme
+        self.workers = workers
+        self.io_slots = threading.Semaphore(io_slots)
 
     def get_folders_to_process(self):
         today = datetime.today().strftime("%Y%m%d")
@@ -45,12 +55,14 @@ class DashProcessor:
         print(f"Eseguo merge m4a: {' '.join(cmd)}")
         subprocess.run(cmd, check=True)
 
-    def create_dash(self, input_file, output_dir, mpd_name):
+    def create_dash(self, input_file, output_dir, mpd_name, concat=False):
         if not os.path.exists(output_dir):
             os.makedirs(output_dir)
         mpd_path = os.path.join(output_dir, mpd_name)
+        # con concat=True input_file e' la lista input.txt: i gruppi vengono letti in sequenza in un solo passaggio
+        input_args = ["-f", "concat", "-safe", "0", "-i", input_file] if concat else ["-i", input_file]
         cmd = [
-            "ffmpeg", "-y", "-i", input_file,
+            "ffmpeg", "-y", *input_args,
             "-c", "copy", "-map", "0:a",
             "-f", "dash",
             "-seg_duration", str(self.segment_duration),
@@ -63,6 +75,13 @@ class DashProcessor:
         subprocess.run(cmd, check=True)
         return mpd_path
 
+    def folder_size(self, folder_path):
+        total = 0
+        for root, _, files in os.walk(folder_path):
+            for file in files:
+                total += os.path.getsize(os.path.join(root, file))
+        return total
+
     def clean_m4a(self, folder_path, files):
         for file in files:
             try:
@@ -71,50 +90,110 @@ class DashProcessor:
             except Exception as e:
                 print(f"Errore cancellando {file}: {e}")
 
-    def run(self):
-        folders = self.get_folders_to_process()
-        if not folders:
-            print("Nessuna cartella da processare.")
-            return
-        for folder in folders:
-            date_folder = os.path.basename(folder)
-            print(f"Processo cartella: {folder}")
-
-            concat_result = self.create_concat_file(folder)
-            if not concat_result:
-                print(f"Nessun file .m4a in {folder}, salto.")
-                continue
-            concat_file, m4a_files = concat_result
-
-            merged_file = os.path.join(folder, "merged.m4a")
-            try:
-                self.merge_m4a(concat_file, merged_file)
+    def checkpoint_path(self, folder_path):
+        return os.path.join(folder_path, ".dash_checkpoint.json")
+
+    def load_checkpoint(self, folder_path):
+        path = self.checkpoint_path(folder_path)
+        if not os.path.exists(path):
+            return {}
+        try:
+            with open(path, "r") as f:
+                return json.load(f)
+        except ValueError:
+            return {}
+
+    def save_checkpoint(self, folder_path, checkpoint):
+        path = self.checkpoint_path(folder_path)
+        with open(path + ".tmp", "w") as f:
+            json.dump(checkpoint, f)
+        os.replace(path + ".tmp", path)
 
-                # Cartella output: archive/YYYYMMDD/
-                archive_output_folder = os.path.join(self.archive_dir, date_folder)
-                dash_output_dir = os.path.join(archive_output_folder, "dash_output")
-                mpd_name = date_folder + ".mpd"
+    def process_folder(self, folder):
+        date_folder = os.path.basename(folder)
+        print(f"Processo cartella: {folder}")
 
-                self.create_dash(merged_file, dash_output_dir, mpd_name)
+        # Ripresa: se il DASH della cartella era gia' pronto si passa direttamente alla pulizia
+        checkpoint = self.load_checkpoint(folder)
+
+        concat_result = self.create_concat_file(folder)
+        if not concat_result:
+            print(f"Nessun file .m4a in {folder}, salto.")
+            if os.path.exists(self.checkpoint_path(folder)):
+                os.remove(self.checkpoint_path(folder))
+            return None
+        concat_file, m4a_files = concat_result
+
+        merged_file = os.path.join(folder, "merged.m4a")
+        started = time.monotonic()
+        try:
+            # Cartella output: archive/YYYYMMDD/
+            archive_output_folder = os.path.join(self.archive_dir, date_folder)
+            dash_output_dir = os.path.join(archive_output_folder, "dash_output")
+            mpd_name = date_folder + ".mpd"
+            mpd_dest = os.path.join(archive_output_folder, mpd_name)
+
+            merged_bytes = 0
+            if checkpoint.get("packaged"):
+                print(f"Cartella {date_folder} gia' impacchettata, riprendo dalla pulizia.")
+            else:
+                # Passi che leggono/scrivono l'intera giornata: limitati a io_slots in parallelo
+                with self.io_slots:
+                    if self.single_pass:
+                        self.create_dash(concat_file, dash_output_dir, mpd_name, concat=True)
+                    else:
+                        self.merge_m4a(concat_file, merged_file)
+                        merged_bytes = os.path.getsize(merged_file)
+                        self.create_dash(merged_file, dash_output_dir, mpd_name)
 
                 # Sposto il file mpd dalla dash_output a archive/YYYYMMDD (permette che sia allo stesso livello di dash_output)
                 mpd_source = os.path.join(dash_output_dir, mpd_name)
-                mpd_dest = os.path.join(archive_output_folder, mpd_name)
                 if not os.path.exists(archive_output_folder):
                     os.makedirs(archive_output_folder)
                 os.rename(mpd_source, mpd_dest)
 
-                # Se tutto ok, pulisco file temporanei
-                self.clean_m4a(folder, m4a_files)
-                os.remove(concat_file)
+                checkpoint["packaged"] = True
+                self.save_checkpoint(folder, checkpoint)
+
+            # Report: tempo totale e byte scritti (compreso l'eventuale merged.m4a intermedio)
+            report = {
+                "folder": date_folder,
+                "mode": "single_pass" if self.single_pass else "merge",
+                "wall_seconds": round(time.monotonic() - started, 3),
+                "bytes_written": self.folder_size(archive_output_folder) + merged_bytes,
+            }
+
+            # Se tutto ok, pulisco file temporanei
+            self.clean_m4a(folder, m4a_files)
+            os.remove(concat_file)
+            if os.path.exists(merged_file):
                 os.remove(merged_file)
+            os.remove(self.checkpoint_path(folder))
+
+            print(f"Processamento cartella {date_folder} completato in {report['wall_seconds']}s, "
+                  f"{report['bytes_written']} byte scritti ({report['mode']}). MPD in {mpd_dest}")
+            return report
+        except subprocess.CalledProcessError as e:
+            print(f"Errore nella elaborazione della cartella {folder}: {e}")
+            return None
 
-                print(f"Processamento cartella {date_folder} completato. MPD in {mpd_dest}")
-            except subprocess.CalledProcessError as e:
-                print(f"Errore nella elaborazione della cartella {folder}: {e}")
+    def run(self):
+        folders = self.get_folders_to_process()
+        if not folders:
+            print("Nessuna cartella da processare.")
+            return []
+        if self.workers <= 1:
+            reports = [self.process_folder(folder) for folder in folders]
+        else:
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                reports = list(executor.map(self.process_folder, folders))
+        return [report for report in reports if report is not None]
 
 if __name__ == "__main__":
     import sys
     script_dir = os.path.dirname(os.path.abspath(__file__))
-    processor = DashProcessor(script_dir)
+    # --merge: vecchio percorso con merged.m4a, utile per confrontare tempi e byte scritti
+    # --workers=N: recupero di piu' giorni arretrati in parallelo
+    workers = next((int(arg.split("=", 1)[1]) for arg in sys.argv if arg.startswith("--workers=")), 1)
+    processor = DashProcessor(script_dir, single_pass="--merge" not in sys.argv, workers=workers, io_slots=max(1, workers // 2))
     processor.run()
@@ -0,0 +1,81 @@
+# Preset di codifica per i gruppi del recorder.
+# Tutti i preset producono un contenitore MP4 (.m4a), cosi' DashProcessor puo'
+# continuare a usare `-c copy`; i preset con hlsCopy=True possono anche essere
+# rimappati in segmenti MPEG-TS (HLS) senza ricodifica. I costi in CPU-secondi e
+# byte per ora registrata si misurano con `python benchmark.py encoders`.
+
+
+EncoderPresets = {
+    # Comportamento storico: AAC 128k CBR a 48 kHz
+    "aac-128k": {
+        "codec": "aac",
+        "bitrate": "128k",
+        "vbr": None,
+        "sampleRate": None,
+        "threads": 1,
+        "format": "ipod",
+        "extension": "m4a",
+        "extraArgs": [],
+        "hlsCopy": True,
+    },
+    # Voce: AAC 32k a 16 kHz, banda sufficiente per il parlato
+    "aac-voice": {
+        "codec": "aac",
+        "bitrate": "32k",
+        "vbr": None,
+        "sampleRate": 16000,
+        "threads": 1,
+        "format": "ipod",
+        "extension": "m4a",
+        "extraArgs": [],
+        "hlsCopy": True,
+    },
+    # Voce: Opus VBR 24k a 16 kHz, il piu' efficiente in byte; in HLS/TS richiede ricodifica
+    "opus-voice": {
+        "codec": "libopus",
+        "bitrate": "24k",
+        "vbr": "on",
+        "sampleRate": 16000,
+        "threads": 1,
+        "format": "mp4",
+        "extension": "m4a",
+        "extraArgs": ["-application", "voip", "-compression_level", "5"],
+        "hlsCopy": False,
+    },
+    # Archivio senza perdita a 16 kHz
+    "flac-16k": {
+        "codec": "flac",
+        "bitrate": None,
+        "vbr": None,
+        "sampleRate": 16000,
+        "threads": 1,
+        "format": "mp4",
+        "extension": "m4a",
+        "extraArgs": ["-sample_fmt", "s16", "-strict", "experimental"],
+        "hlsCopy": False,
+    },
+}
+
+
+
+def getPreset(name:str):
+    if name not in EncoderPresets:
+        raise ValueError(f"Unknown encoder preset '{name}', use one of {list(EncoderPresets)}")
+    return EncoderPresets[name]
+
+
+
+def presetArgs(preset:dict):
+    """Argomenti ffmpeg di output (codec, bitrate/VBR, sample rate, thread) per un preset"""
+    args = ["-c:a", preset["codec"]]
+    if preset["bitrate"]:
+        args += ["-b:a", preset["bitrate"]]
+    if preset["vbr"]:
+        args += ["-vbr", preset["vbr"]]
+    if preset["sampleRate"]:
+        args += ["-ar", str(preset["sampleRate"])]
+    if preset["threads"]:
+        args += ["-threads", str(preset["threads"])]
+    args += preset["extraArgs"]
+    args += ["-f", preset["format"]]
+    return args
@@ -0,0 +1,127 @@
+import time
+import queue
+import multiprocessing
+from multiprocessing import shared_memory
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+from audioEnhancer import AudioEnhancer
+
+
+
+# Stato dei processi worker: un AudioEnhancer e gli slot di memoria condivisa gia' aperti
+_workerEnhancer:AudioEnhancer = None
+_workerSlots = {}
+
+
+
+def _initWorker(enhancerConfig:dict):
+    global _workerEnhancer
+    _workerEnhancer = AudioEnhancer(streaming=False, **enhancerConfig)
+
+
+
+def _enhanceSlot(slotName:str, frames:int, contextFrames:int):
+    slot = _workerSlots.get(slotName)
+    if slot is None:
+        slot = shared_memory.SharedMemory(name=slotName)
+        _workerSlots[slotName] = slot
+    data = np.ndarray((frames,), dtype=np.float32, buffer=slot.buf)
+    # Il risultato torna nello stesso slot: nessun array da 5.7 MB serializzato con pickle.
+    # Il contesto in testa (coda del blocco precedente) assorbe la ripartenza dello stato e viene scartato
+    started = time.thread_time()
+    enhanced = _workerEnhancer.process(data)[contextFrames:]
+    data[:len(enhanced)] = enhanced
+    return len(enhanced), time.thread_time() - started
+
+
+
+class EnhanceJob:
+
+    slot:shared_memory.SharedMemory
+    future:object
+    cpuSeconds:float = 0.0  # tempo CPU del worker, noto dopo result()
+
+    def __init__(self, slot, future):
+        self.slot = slot
+        self.future = future
+
+
+
+class EnhancePool:
+    """Pool di processi per l'enhancement dei blocchi in parallelo.
+
+    I blocchi passano attraverso slot di memoria condivisa preallocati; ogni
+    worker elabora il blocco da solo (streaming=False), quindi il risultato non
+    dipende dal worker che lo ha eseguito. L'ordine di cattura viene ricostruito
+    da chi consuma i job, nell'ordine in cui li ha inviati.
+
+    Ogni job puo' portare in testa la coda grezza del blocco precedente come
+    contesto: fade-in della riduzione rumore e inviluppi di gate/compressore
+    ripartono li' e quella parte dell'uscita viene scartata. Il percorso seriale
+    di i2sRecorder elabora i blocchi nello stesso modo (stesso contesto, stato
+    ripartito, uscita allineata all'ingresso), quindi il risultato e' lo stesso
+    campione per campione: l'unica differenza possibile e' quella di numpy e
+    Pedalboard tra processi, nessuna alla prova su questa macchina."""
+
+    workers:int
+    slotFrames:int
+    executor:ProcessPoolExecutor
+    slots:list
+    freeSlots:queue.Queue
+
+
+
+    def __init__(self, workers:int, slotFrames:int, enhancerConfig:dict, slots:int=None):
+        self.workers = workers
+        self.slotFrames = slotFrames
+
+        # spawn: il processo principale ha gia' il thread PortAudio attivo, fork non e' sicuro
+        self.executor = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_initWorker,
+            initargs=(enhancerConfig,))
+
+        # slots: job in volo in totale; con piu' sorgenti ognuna ne usa al massimo la sua quota
+        self.slots = [shared_memory.SharedMemory(create=True, size=slotFrames * 4) for _ in range(slots or workers * 2)]
+        self.freeSlots = queue.Queue()
+        for slot in self.slots:
+            self.freeSlots.put(slot)
+
+
+
+    @property
+    def capacity(self):
+        return len(self.slots)
+
+
+
+    def submit(self, data:np.ndarray, context:np.ndarray=None):
+        """context: campioni che precedono il blocco, elaborati ma non restituiti"""
+        contextFrames = 0 if context is None else len(context)
+        frames = contextFrames + len(data)
+        if frames > self.slotFrames:
+            raise ValueError(f"Block of {frames} frames exceeds pool slot size {self.slotFrames}")
+        slot = self.freeSlots.get()
+        buffer = np.ndarray((frames,), dtype=np.float32, buffer=slot.buf)
+        buffer[:contextFrames] = context if context is not None else 0
+        buffer[contextFrames:] = data
+        return EnhanceJob(slot, self.executor.submit(_enhanceSlot, slot.name, frames, contextFrames))
+
+
+
+    def result(self, job:EnhanceJob):
+        try:
+            frames, job.cpuSeconds = job.future.result()
+            return np.ndarray((frames,), dtype=np.float32, buffer=job.slot.buf).copy()
+        finally:
+            self.freeSlots.put(job.slot)
+
+
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        for slot in self.slots:
+            slot.close()
+            slot.unlink()
@@ -6,6 +6,7 @@ import threading
 import queue
 import time
 import os
+import collections
 import json
 import traceback
 import noisereduce as nr
@@ -13,6 +14,8 @@ from pathlib import Path
 
 from datetime import datetime
 
+from ringBuffer import RingBuffer
+
 
 
 
@@ -26,6 +29,21 @@ class i2sDevice:
 
     outputStream:None
 
+    inputStream:sd.InputStream = None
+    ringBuffer:RingBuffer = None
+    overflowCount:int = 0
+    callbackCount:int = 0
+
+    # Orologio di cattura: per ogni callback (posizione nel ring, indice di campione, ora reale del primo campione)
+    clockAnchors:collections.deque = None
+    firstAnchor:tuple = None
+    lastAnchor:tuple = None
+    capturedSamples:int = 0
+
+    # Ora reale e indice del primo campione dell'ultimo blocco restituito da captureStream
+    lastCaptureTime:float = None
+    lastCaptureSample:int = 0
+
 
     def __init__(self, device:str, sample_rate:int, channels:int):
         self.deviceSearchingTerm = device
@@ -39,7 +57,7 @@ class i2sDevice:
     def __searchDeviceIndex(self):
         devices = sd.query_devices()
         for i, dev in enumerate(devices):
-            if self.deviceSearchingTerm.lower() in dev['name'].lower() and dev['max_input_channels'] >= 2:
+            if self.deviceSearchingTerm.lower() in dev['name'].lower() and dev['max_input_channels'] >= self.deviceChannels:
                 return i
         raise RuntimeError(f"Device audio using terms '{self.deviceSearchingTerm}' not Found.")
 
@@ -61,11 +79,128 @@ class i2sDevice:
 
 
 
+    def startStream(self, bufferSeconds:int=120, blocksize:int=0):
+        """Apre un InputStream persistente che riempie il ring buffer, da cui poi legge captureStream"""
+        if self.inputStream is not None:
+            return
+
+        self.ringBuffer = RingBuffer(
+            frames = int(bufferSeconds * self.deviceSampleRate),
+            channels = self.deviceChannels
+        )
+        self.overflowCount = 0
+        self.callbackCount = 0
+        self.clockAnchors = collections.deque(maxlen=max(4096, bufferSeconds * 100))
+        self.firstAnchor = None
+        self.lastAnchor = None
+        self.capturedSamples = 0
+
+        self.inputStream = sd.InputStream(
+            samplerate = self.deviceSampleRate,
+            channels = self.deviceChannels,
+            dtype = 'float32',
+            device = self.deviceIndex,
+            blocksize = blocksize,
+            callback = self.__streamCallback
+        )
+        self.inputStream.start()
+        print(f"Device {self.deviceSearchingTerm} streaming started.")
+
+
+
+    def stopStream(self):
+        if self.inputStream is None:
+            return
+        self.inputStream.stop()
+        self.inputStream.close()
+        self.inputStream = None
+        self.ringBuffer.close()
+
+
+
+    def __streamCallback(self, indata, frames, timeInfo, status):
+        # Gira nel thread di PortAudio: solo la copia nel ring preallocato
+        if status.input_overflow:
+            self.overflowCount += 1
+        self.callbackCount += 1
+
+        # inputBufferAdcTime e currentTime sono sull'orologio dello stream: la loro differenza
+        # e' l'eta' del primo campione. Alcuni driver ALSA riportano 0, allora si stima con la durata del blocco
+        if timeInfo.inputBufferAdcTime > 0 and timeInfo.currentTime >= timeInfo.inputBufferAdcTime:
+            age = timeInfo.currentTime - timeInfo.inputBufferAdcTime
+        else:
+            age = frames / self.deviceSampleRate
+        anchor = (self.ringBuffer.writeIndex, self.capturedSamples, time.time() - age)
+        self.clockAnchors.append(anchor)
+        if self.firstAnchor is None:
+            self.firstAnchor = anchor
+        self.lastAnchor = anchor
+
+        self.capturedSamples += frames
+        self.ringBuffer.write(indata)
+
+
+
+    def sampleClock(self, ringIndex:int):
+        """(ora reale, indice di campione) del frame in posizione ringIndex del ring buffer"""
+        anchors = self.clockAnchors
+        # Le ancore gia' superate dalla lettura non servono piu' (l'ultima valida resta in testa)
+        while len(anchors) > 1 and anchors[1][0] <= ringIndex:
+            anchors.popleft()
+        position, sample, wallTime = anchors[0]
+        offset = ringIndex - position
+        return wallTime + offset / self.deviceSampleRate, sample + offset
+
+
+
+    def clockDrift(self):
+        """Deriva cumulativa dell'orologio audio rispetto all'ora di sistema: (secondi, ppm).
+
+        Positiva se il convertitore va piu' lento del nominale (meno campioni di quanti ne servirebbero)."""
+        if self.firstAnchor is None or self.lastAnchor is self.firstAnchor:
+            return 0.0, 0.0
+        _, firstSample, firstTime = self.firstAnchor
+        _, lastSample, lastTime = self.lastAnchor
+        elapsed = lastTime - firstTime
+        drift = elapsed - (lastSample - firstSample) / self.deviceSampleRate
+        return drift, (drift / elapsed * 1e6 if elapsed > 0 else 0.0)
+
+
+
+    def streamStats(self):
+        if self.ringBuffer is None:
+            return {}
+        drift, driftPpm = self.clockDrift()
+        return {
+            "clockDriftSeconds": drift,
+            "clockDriftPpm": driftPpm,
+            "overflows": self.overflowCount,
+            "droppedFrames": self.ringBuffer.droppedFrames,
+            "capturedFrames": self.ringBuffer.writeIndex,
+            "readFrames": self.ringBuffer.readIndex,
+            "bufferedFrames": self.ringBuffer.available(),
+            "callbacks": self.callbackCount,
+        }
+
+
+
     def captureStream(self, duration:int):
+        """Mono: array 1-D. Piu' canali: array (frame, canali), da cui si prendono viste per canale senza copie"""
         if not self.deviceReady:
             print("No stream recorded, device not found.")
             return
-        
+
+        if self.inputStream is not None:
+            # Blocco di lunghezza fissa preso dallo stream continuo: nessun buco tra una chiamata e l'altra
+            ringIndex = self.ringBuffer.readIndex
+            outputAudio = self.__frames(self.ringBuffer.read(int(duration * self.deviceSampleRate)))
+            self.lastCaptureTime, self.lastCaptureSample = self.sampleClock(ringIndex)
+            self.outputStream = outputAudio
+            return outputAudio
+
+        # sd.rec apre uno stream a ogni chiamata: l'ora del primo campione e' solo approssimata
+        self.lastCaptureTime = time.time()
+        self.lastCaptureSample = self.capturedSamples
         stream = sd.rec(
             frames = int(duration * self.deviceSampleRate),
             samplerate = self.deviceSampleRate,
@@ -74,12 +209,19 @@ class i2sDevice:
             device = self.deviceIndex 
         )
         sd.wait()
-        outputAudio = stream.flatten()
+        self.capturedSamples += len(stream)
+        outputAudio = self.__frames(stream)
         self.outputStream = outputAudio
         return outputAudio
     
 
 
+    def __frames(self, block:np.ndarray):
+        # ravel di un blocco (frame, 1) contiguo e' una vista, flatten farebbe sempre una copia
+        return block.ravel() if self.deviceChannels == 1 else block
+
+
+
     def saveAudio(self, fullpath:str, bitrate:int, bitrate_mode:str='CONSTANT'):
         if self.outputStream is not None:
             sf.write(fullpath, self.outputStream, bitrate=bitrate, bitrate_mode=bitrate_mode)
@@ -1,80 +1,270 @@
 import numpy as np
 import soundfile as sf
-from pydub import AudioSegment
 import threading
 import queue
 import time
 import os
 import traceback
+import json
+import copy
+import collections
 from pathlib import Path
 
-from i2sDevice import i2sDevice
+from trackJournal import TrackJournal
+from streamEncoder import StreamEncoder
+from audioEnhancer import AudioEnhancer
+from enhancePool import EnhancePool, EnhanceJob
+from livePackager import LiveHLSPackager
+from encoderPresets import getPreset
+from streamResampler import StreamResampler
+from voiceActivity import VoiceActivityDetector
+from archiveIndex import ArchiveIndex
+from metrics import MetricsRegistry, threadCpuCollector
+from profiler import Profiler
 
 from datetime import datetime
 
-import noisereduce as nr
-from pedalboard import *
+
+
+class DroppedBlock:
+    """Segnaposto in volo di un blocco silenzioso da scartare (SilencePolicy "drop") nel pool"""
+
+    def __init__(self, data):
+        self.data = data
 
 
 
 class i2sRecorder:
 
     FrameRate:int = 48000
+    ProcessingRate:int = 48000  # es. 16000 o 24000 per la sola voce: tutta la catena a valle della cattura lavora a questa frequenza
     SingleTrackDuration:int = 30
     ProcessingTrackDuration:int = 600
-    ChannelToKeep:int = 0
+    ChannelToKeep:int = 0  # canale registrato: il device viene aperto con ChannelToKeep + 1 canali
     Amplify_dB:int = 40
+    DSPBlockSize:int = 8192
+
+    NoiseReductionMode:str = "streaming"  # "streaming" = profilo appreso e STFT continua, "nonstationary" = noisereduce per blocco
+    NoiseReductionQuality:str = "medium"  # "low" / "medium" / "high": compromesso qualita'/CPU
+    NoiseReductionDecrease:float = 0.60
+
+    # Rilevamento voce prima dell'enhancement: i blocchi di solo silenzio non passano dalla catena DSP.
+    # SilencePolicy "encode" = all'encoder va il blocco solo amplificato (parole brevi sotto VADMinSpeechRatio
+    # restano udibili), "drop" = il blocco non viene salvato e l'intervallo finisce in gaps.jsonl nella cartella del giorno
+    VADEnabled:bool = True
+    VADMarginDb:float = 10.0
+    VADMinSpeechRatio:float = 0.03
+    SilencePolicy:str = "encode"
+
+    ProcessingWorkers:int = 1  # >1: pool di processi, ogni blocco elaborato da solo e riordinato prima del gruppo
+    EnhanceContextSeconds:float = 1.0  # coda del blocco precedente elaborata in testa ad ogni blocco e poi scartata
+
+    CaptureMode:str = "stream"  # "stream" = InputStream persistente, "rec" = un sd.rec per traccia
+    CaptureBufferSeconds:int = 120
+
+    InMemoryPipeline:bool = False  # passa i buffer numpy al processor senza WAV intermedi
+    TrackQueueSize:int = 8
+    SaveQueueSize:int = 4
+    JournalEnabled:bool = True  # in memoria: PCM nel journal; modalita' file: solo i riferimenti ai WAV
+    # Recupero all'avvio delle tracce non ancora finite in un gruppo (vedi recoveryWorker)
+    RecoveryEnhanceSeconds:int = 3600  # oltre quest'arretrato le tracce piu' vecchie si recuperano senza enhancement
+    RecoveryNice:int = 10
+
+    # Politica di sovraccarico quando il processor resta indietro:
+    # "block" = il writer attende, "raw" = oltre OverloadHighWater i blocchi saltano l'enhancement,
+    # "spill" = a coda piena i blocchi vengono parcheggiati su disco in FLAC e ripresi in ordine
+    OverloadPolicy:str = "spill"
+    OverloadHighWater:int = 4
+    SpillDir:str = os.path.join("audio_logs", "spill")
+
+    EncoderPreset:str = "aac-128k"  # vedi encoderPresets.py: aac-128k, aac-voice, opus-voice, flac-16k
+    LivePackaging:bool = True  # ogni gruppo diventa subito un segmento della playlist HLS del giorno
+    ArchiveIndexName:str = "archive.sqlite"  # indice temporale dei gruppi in ProcessedDir, vedi archiveIndex.py
+
+    MetricsPort:int = 9108  # endpoint Prometheus su 127.0.0.1, None per disattivarlo
+    MetricsSnapshotFile:str = "metrics.json"  # snapshot JSON periodico in AudioTracksDir, None per disattivarlo
+    MetricsSnapshotInterval:int = 30
+
+    # Profilazione spenta di default: si accende/spegne con kill -USR1 <pid> o creando/cancellando il file di controllo
+    ProfileDir:str = "profiles"
+    ProfileControlFile:str = "PROFILE"
 
     AudioTracksDir:str = "audio_logs"
     ProcessedDir:str = "processed_audio"
     TrackFileQueue:queue.Queue
-    BufferBlocks = []
+    SaveQueue:queue.Queue
+    SpillQueue:collections.deque
+    SpillLock:threading.Lock
     FileBlocks = []
 
+    Stats:dict
+
+    GroupEncoder:StreamEncoder = None
+    GroupStartTime:datetime = None
+    GroupStartSample:int = 0
+    GroupEndTime:float = None
+    GroupBlockCount:int = 0
+    GroupLastSeq:int = None
+    GroupBlocks:list = None  # per l'indice: (ora del primo campione, offset nel gruppo, frame, campione di cattura) di ogni blocco
+
     i2sAudioDevice:str = "googlevoicehat"
+    SourceName:str = None  # nome della sorgente quando il recorder fa parte di un MultiSourceRecorder
+    PoolShare:int = 1  # sorgenti che condividono il pool: ognuna tiene in volo al massimo capacity / PoolShare job
 
     AmplifyFactor:int
+    Enhancer:AudioEnhancer
+    EnhanceContext:np.ndarray = None  # coda dell'ultimo blocco letto, contesto del blocco successivo
+    EnhanceContextEnd:int = None  # campione di cattura che segue EnhanceContext
+    Pool:EnhancePool = None
 
-    i2sDev:i2sDevice
+    i2sDev:"i2sDevice"
+    Journal:TrackJournal = None
+    JournalFloor:int = 0  # le sequenze del journal sotto questa sono dell'esecuzione precedente, del recupero
+    RecoveringSince:float = None  # ora del primo campione non ancora recuperato (gruppo aperto compreso)
+    Recovering:bool = False  # True nella copia del recorder che esegue il recupero
+    Packager:LiveHLSPackager = None
+    Resampler:StreamResampler = None
+    VAD:VoiceActivityDetector = None
+    Index:ArchiveIndex = None
+    Metrics:MetricsRegistry
+    StageMetrics:dict
+    Profiler:Profiler
+    DayStats:dict
+    DayStatsLock:threading.Lock  # condiviso con la copia del recorder che esegue il recupero
+    GroupListeners:list
 
-    def __init__(self):
+    def __init__(self, device=None, metrics:MetricsRegistry=None, profiler:Profiler=None, pool:EnhancePool=None):
 
         print("Preparing Folder...")
         os.makedirs(self.AudioTracksDir, exist_ok=True)
         os.makedirs(self.ProcessedDir, exist_ok=True)
 
         print("Preparing Device...")
-        self.i2sDev = i2sDevice(
-            device=self.i2sAudioDevice,
-            sample_rate=self.FrameRate,
-            channels=1)
+        # device: sorgente gia' pronta con la stessa interfaccia di i2sDevice (es. FakeI2sDevice di benchmark.py).
+        # sounddevice (PortAudio) si importa solo per il device reale: i benchmark girano anche senza scheda audio
+        if device is None:
+            from i2sDevice import i2sDevice
+            device = i2sDevice(
+                device=self.i2sAudioDevice,
+                sample_rate=self.FrameRate,
+                channels=self.ChannelToKeep + 1)
+        self.i2sDev = device
         
         if not self.i2sDev.deviceReady:
             raise Exception(f"Unable to find Device {self.i2sAudioDevice}.")
         
         print("Preparing configuration...")
         self.AmplifyFactor = 10 ** (self.Amplify_dB / 20)
-        self.TrackFileQueue = queue.Queue()
+        if self.VADEnabled:
+            self.VAD = VoiceActivityDetector(self.ProcessingRate, marginDb=self.VADMarginDb, minSpeechRatio=self.VADMinSpeechRatio)
+        self.DayStats = {}
+        self.DayStatsLock = threading.Lock()
+        if self.ProcessingRate != self.FrameRate:
+            self.Resampler = StreamResampler(self.FrameRate, self.ProcessingRate)
+        self.buildEnhancer()
+        self.TrackFileQueue = queue.Queue(maxsize=self.TrackQueueSize)
+        self.SaveQueue = queue.Queue(maxsize=self.SaveQueueSize)
+        self.SpillQueue = collections.deque()
+        self.SpillLock = threading.Lock()
+        self.FileBlocks = []
+        self.GroupListeners = []
+        if self.JournalEnabled:
+            self.Journal = TrackJournal(self.AudioTracksDir, self.ProcessingRate)
+        if self.LivePackaging and not getPreset(self.EncoderPreset)["hlsCopy"]:
+            print(f"Live packaging disabled: preset {self.EncoderPreset} cannot be copied into HLS segments.")
+        elif self.LivePackaging:
+            self.Packager = LiveHLSPackager(self.ProcessedDir, targetDuration=self.ProcessingTrackDuration)
+        if self.ArchiveIndexName:
+            self.Index = ArchiveIndex(os.path.join(self.ProcessedDir, self.ArchiveIndexName))
 
-        
+        # metrics/profiler/pool passati da MultiSourceRecorder sono condivisi tra le sorgenti
+        self.Pool = pool
+        self.Profiler = profiler or Profiler(self.ProfileDir, controlFile=self.ProfileControlFile)
+        if metrics is None:
+            metrics = MetricsRegistry()
+            metrics.addCollector(threadCpuCollector)
+        self.Metrics = metrics
+        self.Metrics.addCollector(self.collectMetrics)
+        # Creati una volta sola: sul percorso caldo solo observe()/set()
+        self.StageMetrics = {
+            stage: (
+                self.Metrics.histogram("stage_seconds", "Latency of each pipeline stage per block", self.labels(stage=stage)),
+                self.Metrics.gauge("stage_realtime_factor", "Audio seconds processed per second of stage time, last block", self.labels(stage=stage)),
+            )
+            for stage in ("capture", "resample", "store", "vad", "enhance", "noise_reduction", "pedalboard", "encode", "package", "index")
+        }
+        self.BytesWritten = self.Metrics.counter("bytes_written_total", "Bytes written to disk (tracks, spill, journal, groups, segments)", self.labels())
+        self.EncoderCpu = self.Metrics.counter("encoder_cpu_seconds_total", "CPU time of the ffmpeg group encoders", self.labels())
+        self.RecoveredBlocks = self.Metrics.counter("recovered_blocks_total", "Blocks rebuilt from the journal after a restart", self.labels())
 
-    def startRecording(self):
-        self.RecordingThread = threading.Thread(target=self.recordWorker, daemon=True)
+        self.Stats = {
+            "queueDepth": 0,
+            "saveQueueDepth": 0,
+            "spilledBlocks": 0,
+            "rawBlocks": 0,
+            "lagSeconds": 0.0,
+            "maxLagSeconds": 0.0,
+            "processedUntil": 0.0,
+            "clockDriftSeconds": 0.0,
+            "clockDriftPpm": 0.0,
+        }
 
-        self.ProcessingThread = threading.Thread(target=self.processAudioWorker, daemon=True)
+        if self.Journal is not None:
+            self.prepareRecovery()
 
-        self.RecordingThread.start()
-        self.ProcessingThread.start()
+        
+
+    def startRecording(self):
+        self.start()
 
         try:
             while True:
                 time.sleep(1)
         except KeyboardInterrupt:
             print("Terminazione richiesta dall'utente.")
+            self.Profiler.stop()
     
 
 
 
+    def start(self):
+        """Profiler, metriche e thread della pipeline, senza bloccare (va chiamato dal thread principale)"""
+        self.Profiler.install()
+        if self.MetricsPort:
+            self.Metrics.serve(self.MetricsPort)
+        if self.MetricsSnapshotFile:
+            self.Metrics.startSnapshots(os.path.join(self.AudioTracksDir, self.MetricsSnapshotFile), self.MetricsSnapshotInterval)
+
+        self.startWorkers()
+
+
+
+    def startWorkers(self):
+        suffix = f"-{self.SourceName}" if self.SourceName else ""
+        self.RecordingThread = threading.Thread(target=self.recordWorker, name="Recording" + suffix, daemon=True)
+
+        self.SavingThread = threading.Thread(target=self.saveWorker, name="Saving" + suffix, daemon=True)
+
+        self.ProcessingThread = threading.Thread(target=self.processAudioWorker, name="Processing" + suffix, daemon=True)
+
+        self.RecordingThread.start()
+        self.SavingThread.start()
+        self.ProcessingThread.start()
+
+        # Dopo la cattura: il recupero gira in parallelo alla pipeline live, a priorita' piu' bassa
+        if self.RecoveringSince is not None:
+            threading.Thread(target=self.recoveryWorker, name="Recovery" + suffix, daemon=True).start()
+
+
+
+    def labels(self, **labels):
+        """Etichette delle metriche, con il nome della sorgente se il recorder ne ha uno"""
+        if self.SourceName:
+            labels["source"] = self.SourceName
+        return labels
+
+
+
     def recordTrack(self, duration:int=30):
         singleTrack = self.i2sDev.captureStream(duration=duration)
         return singleTrack
@@ -84,117 +274,764 @@ class i2sRecorder:
 
     def recordWorker(self):
         """Registra WAV stereo da device, salva file da 5s e mette in coda il path"""
+        if self.CaptureMode == "stream":
+            self.i2sDev.startStream(bufferSeconds=self.CaptureBufferSeconds)
+
         while True:
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            filename = os.path.join(self.AudioTracksDir, f"rec_{timestamp}_stereo.wav")
-            
-            print(f"[Recorder] Registrazione in corso: {filename}")
-            
-            singleTrack = self.i2sDev.captureStream(duration=self.SingleTrackDuration)
+            # Un solo thread di scrittura riutilizzato: se resta indietro, la cattura attende sul ring buffer
+            self.SaveQueue.put(self.captureEntry())
+            self.Stats["saveQueueDepth"] = self.SaveQueue.qsize()
+
+
+
+    def captureEntry(self):
+        """Cattura un blocco e lo descrive con l'ora reale e l'indice del suo primo campione"""
+        print(f"[Recorder] Registrazione in corso...")
+
+        started = time.perf_counter()
+        singleTrack = self.i2sDev.captureStream(duration=self.SingleTrackDuration)
+        if singleTrack.ndim > 1:
+            # Vista sul canale, nessuna copia: la prima copia e' quella del ricampionamento o del journal
+            singleTrack = singleTrack[:, self.ChannelToKeep]
+        # Attesa del blocco: vicina a SingleTrackDuration a regime, quasi zero se la cattura e' in arretrato
+        self.observeStage("capture", time.perf_counter() - started, self.SingleTrackDuration)
+
+        # Ora reale e indice del primo campione, dall'orologio audio e non dall'inizio del ciclo
+        startTime = self.i2sDev.lastCaptureTime
+        captureSeconds = self.i2sDev.lastCaptureSample / self.FrameRate
+        if self.Resampler is not None:
+            # Il primo campione in uscita precede quello catturato del ritardo residuo del ricampionatore
+            offset = self.Resampler.timeOffset()
+            startTime -= offset
+            captureSeconds -= offset
+            started = time.perf_counter()
+            singleTrack = self.Resampler.process(singleTrack)
+            self.observeStage("resample", time.perf_counter() - started, self.SingleTrackDuration)
+        sampleIndex = round(captureSeconds * self.ProcessingRate)
 
-            saveThread = threading.Thread(target=self.saveTrack, args=(filename, singleTrack), daemon=True)
-            saveThread.start()
+        timestamp = datetime.fromtimestamp(startTime).strftime("%Y%m%d_%H%M%S")
+        filename = os.path.join(self.AudioTracksDir, f"rec_{timestamp}_stereo.wav")
+
+        if self.CaptureMode == "stream":
+            stats = self.i2sDev.streamStats()
+            self.Stats["clockDriftSeconds"] = stats["clockDriftSeconds"]
+            self.Stats["clockDriftPpm"] = stats["clockDriftPpm"]
+            print(f"[Recorder] Overflow: {stats['overflows']}, frame persi: {stats['droppedFrames']}, in buffer: {stats['bufferedFrames']}, "
+                  f"deriva orologio: {stats['clockDriftSeconds'] * 1000:.1f} ms ({stats['clockDriftPpm']:.1f} ppm)")
+
+        return {"name": filename, "track": singleTrack, "captured": time.time(),
+                "startTime": startTime, "sampleIndex": sampleIndex}
+
+
+
+    def saveWorker(self):
+        """Scrive (o mette nel journal) le tracce catturate e le passa al processor"""
+        while True:
+            entry = self.SaveQueue.get()
+            try:
+                self.enqueueTrack(self.storeTrack(entry))
+            except Exception as e:
+                print(f"[Writer] Errore durante il salvataggio di {entry['name']}: {e}")
+                traceback.print_exc()
+            finally:
+                self.SaveQueue.task_done()
 
             
     
+    def storeTrack(self, entry):
+        """Traccia catturata -> elemento della coda del processor (in memoria + journal, oppure file WAV)"""
+        started = time.perf_counter()
+        item = {"name": entry["name"], "data": None, "seq": None, "captured": entry["captured"], "raw": False,
+                "startTime": entry["startTime"], "sampleIndex": entry["sampleIndex"]}
+        if self.InMemoryPipeline:
+            item["data"] = entry["track"]
+            if self.Journal is not None:
+                item["seq"] = self.Journal.append(entry["name"], entry["track"], entry["startTime"], entry["sampleIndex"])
+                self.BytesWritten.inc(len(entry["track"]) * 2)
+        else:
+            self.saveTrack(entry["name"], entry["track"])
+            self.BytesWritten.inc(os.path.getsize(entry["name"]))
+            if self.Journal is not None:
+                item["seq"] = self.Journal.appendFile(entry["name"], entry["startTime"], entry["sampleIndex"])
+        self.observeStage("store", time.perf_counter() - started, len(entry["track"]) / self.ProcessingRate)
+        return item
+
+
+
     def saveTrack(self, filename, track):
-        sf.write(filename, track, self.FrameRate, subtype='FLOAT')
-        self.TrackFileQueue.put(filename)
+        sf.write(filename, track, self.ProcessingRate, subtype='FLOAT')
+
+
+
+    def enqueueTrack(self, item):
+        """Applica la politica di sovraccarico prima di mettere la traccia in coda"""
+        depth = self.TrackFileQueue.qsize()
+        self.Stats["queueDepth"] = depth
+
+        if self.OverloadPolicy == "raw" and depth >= self.OverloadHighWater:
+            item["raw"] = True
+            self.Stats["rawBlocks"] += 1
+
+        if self.OverloadPolicy != "spill":
+            self.TrackFileQueue.put(item)
+            return
+
+        with self.SpillLock:
+            # Se ci sono blocchi parcheggiati anche i nuovi vanno in coda a loro, per non perdere l'ordine
+            if not self.SpillQueue:
+                try:
+                    self.TrackFileQueue.put_nowait(item)
+                    return
+                except queue.Full:
+                    pass
+            self.SpillQueue.append(self.spillTrack(item))
+            self.Stats["spilledBlocks"] += 1
+            print(f"[Writer] Processor in ritardo, blocco parcheggiato su disco: {item['name']} ({len(self.SpillQueue)} in attesa)")
+
+
+
+    def spillTrack(self, item):
+        if item["data"] is None:
+            # Modalita' file: la traccia e' gia' su disco, basta tenerne il riferimento
+            return item
+        os.makedirs(self.SpillDir, exist_ok=True)
+        spillPath = os.path.join(self.SpillDir, os.path.splitext(os.path.basename(item["name"]))[0] + ".flac")
+        sf.write(spillPath, item["data"], self.ProcessingRate, subtype='PCM_16')
+        self.BytesWritten.inc(os.path.getsize(spillPath))
+        return dict(item, name=spillPath, data=None)
+
+
+
+    def refillFromSpill(self):
+        """Riporta in coda i blocchi parcheggiati, dal piu' vecchio, finche' c'e' posto"""
+        if not self.SpillQueue:
+            return
+        with self.SpillLock:
+            while self.SpillQueue:
+                try:
+                    self.TrackFileQueue.put_nowait(self.SpillQueue[0])
+                except queue.Full:
+                    break
+                self.SpillQueue.popleft()
+
+
+
+    def trackLag(self, item):
+        lag = time.time() - item["captured"]
+        self.Stats["lagSeconds"] = lag
+        self.Stats["maxLagSeconds"] = max(self.Stats["maxLagSeconds"], lag)
+        self.Stats["processedUntil"] = item["startTime"]
+        self.Stats["queueDepth"] = self.TrackFileQueue.qsize()
+        print(f"[Processor] Coda: {self.Stats['queueDepth']}, parcheggiati: {len(self.SpillQueue)}, ritardo sul tempo reale: {lag:.1f}s")
+
+
+
 
+    def loadTrack(self, item):
+        print(f"[Processor] Elaborazione file: {item['name']}")
+        data = item["data"]
+        if data is None:
+            data, _ = sf.read(item["name"], dtype='float32')
+        return data
 
 
 
     def processAudioWorker(self):
-        """Consuma file WAV, filtra, amplifica e salva gruppi da 10 minuti in OGG"""
-        block_count = 0
-        group_start_time = None
+        """Consuma le tracce in coda, filtra, amplifica e accoda i blocchi al gruppo da 10 minuti"""
+        if self.ProcessingWorkers > 1:
+            return self.processPoolWorker()
 
         while True:
-            filename = self.TrackFileQueue.get()
+            item = self.TrackFileQueue.get()
             try:
-                print(f"[Processor] Elaborazione file: {filename}")
-                data, fs = sf.read(filename)
-                
-                enhanced = self.enhancedAudio(data)
-                
-                
-                # Aggiungi blocco al buffer
-                self.BufferBlocks.append(enhanced)
-                self.FileBlocks.append(filename)
-                block_count += 1
-
-                # Imposta il tempo iniziale per il nome file del gruppo
-                if group_start_time is None:
-                    group_start_time = datetime.now().strftime("%Y%m%d_%H%M%S")
-
-                # Quando il buffer raggiunge 120 blocchi (10 minuti)
-                if block_count == (self.ProcessingTrackDuration / self.SingleTrackDuration):
-                    print(f"[Processor] Salvando gruppo da {self.ProcessingTrackDuration / 60} minuti: {group_start_time}")
-                    combined = np.concatenate(self.BufferBlocks)
-
-                    # Salva WAV mono temporaneo del gruppo
-                    wav_group_path = os.path.join(self.ProcessedDir, f"group_{group_start_time}_mono.wav")
-                    sf.write(wav_group_path, combined, fs, subtype='FLOAT')
-
-                    # Converti in OGG
-                    audio_segment = AudioSegment.from_wav(wav_group_path)
-
-                    # Preparazione cartella di destinazione con la data odierna
-                    destFolder = os.path.join(self.ProcessedDir, datetime.now().strftime("%Y%m%d"))
-                    Path(destFolder).mkdir(parents=True,exist_ok=True)
-
-                    ogg_path = os.path.join(destFolder, f"group_{group_start_time}.m4a")
-                    audio_segment.export(ogg_path, format="ipod", bitrate="128k")
-                    
-                    print(f"[Processor] Gruppo da 10 minuti salvato: {ogg_path}")
-
-                    # Pulizia temporanei
-                    os.remove(wav_group_path)
-
-                    # Pulizia AudioBlocks
-                    for f in self.FileBlocks:
-                        try:
-                            os.remove(f)
-                        except:
-                            print(f"Impossibile eliminare il file {f}")
-
-                    # Reset buffer
-                    self.BufferBlocks = []
-                    self.FileBlocks = []
-                    block_count = 0
-                    group_start_time = None
+                self.processTrack(item)
+            finally:
+                self.TrackFileQueue.task_done()
+                self.refillFromSpill()
+
+
+
+    def processTrack(self, item):
+        """Un blocco nel thread corrente: VAD, enhancement (o silenzio/grezzo) e scrittura nel gruppo"""
+        try:
+            data = self.loadTrack(item)
+            self.trackLag(item)
+
+            silent = self.isSilent(item, data)
+            context = self.blockContext(item, data)
+            if silent and self.SilencePolicy == "drop":
+                self.dropBlock(item, data)
+                return
+
+            if silent:
+                enhanced = self.silentAudio(data)
+            elif item["raw"]:
+                enhanced = self.rawAudio(data)
+            else:
+                started = time.thread_time()
+                enhanced = self.enhancedAudio(data, context)
+                self.dayStats(item)["enhanceCpuSeconds"] += time.thread_time() - started
+                self.dayStats(item)["enhancedChunks"] += 1
+
+            self.appendBlock(enhanced, item)
+
+        except Exception as e:
+            print(f"[Processor] Errore durante l'elaborazione: {e}")
+            traceback.print_exc()
+            self.abortGroup()
+
+
+
+    def blockContext(self, item, data):
+        """Contesto del blocco (coda del blocco precedente, None dopo un salto di campioni) e tiene quello del successivo.
 
+        Seriale e pool lo usano allo stesso modo, per ogni blocco letto: elaborato o no, scartato compreso."""
+        context = self.EnhanceContext
+        if self.EnhanceContextEnd is None or abs(item["sampleIndex"] - self.EnhanceContextEnd) > self.ProcessingRate // 10:
+            context = None
+        contextFrames = int(self.EnhanceContextSeconds * self.ProcessingRate)
+        # Copia: il blocco puo' stare in un buffer riusato dalla cattura
+        self.EnhanceContext = data[-contextFrames:].copy() if contextFrames else None
+        self.EnhanceContextEnd = item["sampleIndex"] + len(data)
+        return context
+
+
+
+    def processPoolWorker(self):
+        """Come processAudioWorker, ma l'enhancement gira nel pool: i job sono raccolti nell'ordine di invio"""
+        if self.Pool is None:
+            self.Pool = EnhancePool(
+                workers=self.ProcessingWorkers,
+                slotFrames=self.poolSlotFrames(),
+                enhancerConfig=self.enhancerConfig())
+        # Con il pool condiviso nessuna sorgente puo' occupare gli slot delle altre (si bloccherebbero a vicenda)
+        maxInflight = max(1, self.Pool.capacity // self.PoolShare)
+        inflight = collections.deque()
+
+        while True:
+            if len(inflight) < maxInflight:
+                try:
+                    item = self.TrackFileQueue.get(block=not inflight)
+                except queue.Empty:
+                    item = None
+
+                if item is not None:
+                    try:
+                        data = self.loadTrack(item)
+                        self.trackLag(item)
+                        silent = self.isSilent(item, data)
+                        context = self.blockContext(item, data)
+                        if silent and self.SilencePolicy == "drop":
+                            # Scartato nel suo turno: prima vanno chiusi/scritti i blocchi precedenti ancora in volo
+                            job = DroppedBlock(data)
+                        elif silent:
+                            job = self.silentAudio(data)
+                        elif item["raw"]:
+                            job = self.rawAudio(data)
+                        else:
+                            job = self.Pool.submit(data, context=context)
+                        inflight.append((item, job))
+                    except Exception as e:
+                        print(f"[Processor] Errore durante l'elaborazione: {e}")
+                        traceback.print_exc()
+                        self.TrackFileQueue.task_done()
+                        self.refillFromSpill()
+                    continue
+
+            # Sequenziamento: si attende sempre il job piu' vecchio, i gruppi restano in ordine di cattura
+            item, job = inflight.popleft()
+            try:
+                if isinstance(job, DroppedBlock):
+                    self.dropBlock(item, job.data)
+                    continue
+                enhanced = job
+                if isinstance(job, EnhanceJob):
+                    enhanced = self.Pool.result(job)
+                    # Tempo CPU del worker: senza, cpuSecondsSaved delle statistiche VAD resterebbe a zero
+                    self.dayStats(item)["enhanceCpuSeconds"] += job.cpuSeconds
+                    self.dayStats(item)["enhancedChunks"] += 1
+                self.appendBlock(enhanced, item)
             except Exception as e:
                 print(f"[Processor] Errore durante l'elaborazione: {e}")
                 traceback.print_exc()
-
+                self.abortGroup()
             finally:
                 self.TrackFileQueue.task_done()
+                self.refillFromSpill()
 
 
 
-    def enhancedAudio(self, data):
+    def poolSlotFrames(self):
+        """Frame per slot del pool: un blocco piu' il contesto del blocco precedente"""
+        return int((self.SingleTrackDuration + self.EnhanceContextSeconds) * self.ProcessingRate) + 1
 
-        amplifiedBoard = Pedalboard([
-            Gain(gain_db=40)
-        ])
-        print("Amplifying...")
-        amplified = amplifiedBoard(data, self.FrameRate)
-    
 
-        reduced_noise = nr.reduce_noise(y=amplified, sr=self.FrameRate, stationary=False, prop_decrease=0.60)
+
+    def isSilent(self, item, data):
+        if self.VAD is None:
+            return False
+        started = time.perf_counter()
+        speech, ratio, _ = self.VAD.classify(data)
+        self.observeStage("vad", time.perf_counter() - started, len(data) / self.ProcessingRate)
+        stats = self.dayStats(item)
+        stats["chunks"] += 1
+        if not speech:
+            stats["silentChunks"] += 1
+            stats["silentSeconds"] += len(data) / self.ProcessingRate
+            print(f"[Processor] Blocco silenzioso ({ratio:.1%} frame con voce), enhancement saltato")
+        return not speech
+
 
 
-        enhancedBoard = Pedalboard([
-            NoiseGate(threshold_db=-35, ratio=2.0, release_ms=200), # Soglia più bassa, rapporto più deciso, rilascio più rapido
-            Compressor(threshold_db=-20, ratio=3.0, attack_ms=5, release_ms=100), # Parametri più reattivi per la voce
-            LowShelfFilter(cutoff_frequency_hz=350, gain_db=-6, q=0.707), # Taglia le basse-medie problematiche (-6dB è un taglio significativo)
-            HighShelfFilter(cutoff_frequency_hz=3000, gain_db=5, q=0.707), # Boost significativo sopra i 3kHz per chiarezza e "aria"
-            Gain(gain_db=5) # Aggiusta questo per il volume desiderato
-        ])
-        enhanced = enhancedBoard(reduced_noise, self.FrameRate)
+    def dayStats(self, item):
+        day = datetime.fromtimestamp(item["startTime"]).strftime("%Y%m%d")
+        with self.DayStatsLock:
+            if day not in self.DayStats:
+                self.DayStats[day] = {
+                    "chunks": 0,
+                    "silentChunks": 0,
+                    "silentSeconds": 0.0,
+                    "droppedChunks": 0,
+                    "droppedSeconds": 0.0,
+                    "enhancedChunks": 0,
+                    "enhanceCpuSeconds": 0.0,
+                    "encodedSeconds": 0.0,
+                    "encodedBytes": 0,
+                }
+            return self.DayStats[day]
+
+
+
+    def saveDayStats(self):
+        """Statistiche VAD del giorno, con la stima di CPU e spazio risparmiati"""
+        with self.DayStatsLock:
+            self.__saveDayStats()
+
+
+
+    def __saveDayStats(self):
+        for day, stats in list(self.DayStats.items()):
+            report = dict(stats)
+            cpuPerChunk = stats["enhanceCpuSeconds"] / stats["enhancedChunks"] if stats["enhancedChunks"] else 0.0
+            bytesPerSecond = stats["encodedBytes"] / stats["encodedSeconds"] if stats["encodedSeconds"] else 0.0
+            report["cpuSecondsSaved"] = round(cpuPerChunk * stats["silentChunks"], 1)
+            report["bytesSaved"] = int(bytesPerSecond * stats["droppedSeconds"])
+
+            dayFolder = os.path.join(self.ProcessedDir, day)
+            os.makedirs(dayFolder, exist_ok=True)
+            with open(os.path.join(dayFolder, "vad_stats.json"), "w", encoding="utf-8") as f:
+                json.dump(report, f, indent=1)
+
+            if day < datetime.now().strftime("%Y%m%d"):
+                del self.DayStats[day]
+
+
+
+    def dropBlock(self, item, data):
+        """Blocco di silenzio scartato: resta traccia dell'intervallo mancante"""
+        stats = self.dayStats(item)
+        duration = len(data) / self.ProcessingRate
+        stats["droppedChunks"] += 1
+        stats["droppedSeconds"] += duration
+
+        startTime = datetime.fromtimestamp(item["startTime"])
+        dayFolder = os.path.join(self.ProcessedDir, startTime.strftime("%Y%m%d"))
+        os.makedirs(dayFolder, exist_ok=True)
+        gap = {
+            "start": startTime.isoformat(timespec="milliseconds"),
+            "end": datetime.fromtimestamp(item["startTime"] + duration).isoformat(timespec="milliseconds"),
+            "name": os.path.basename(item["name"]),
+        }
+        with open(os.path.join(dayFolder, "gaps.jsonl"), "a", encoding="utf-8") as f:
+            f.write(json.dumps(gap) + "\n")
+
+        if self.GroupEncoder is not None:
+            # Il blocco appartiene al gruppo aperto: si libera con lui
+            if item["data"] is None:
+                self.FileBlocks.append(item["name"])
+            if item["seq"] is not None:
+                self.GroupLastSeq = item["seq"]
+            return
+
+        # Nessun gruppo aperto (silenzio continuo): niente da attendere
+        if item["data"] is None:
+            try:
+                os.remove(item["name"])
+            except OSError:
+                print(f"Impossibile eliminare il file {item['name']}")
+        if item["seq"] is not None:
+            self.Journal.commit(item["seq"], firstSeq=self.JournalFloor)
+
+
+
+    def appendBlock(self, enhanced, item):
+        """Scrive il blocco nell'encoder del gruppo corrente, chiudendo il gruppo quando e' completo"""
+        if self.GroupEncoder is not None:
+            # Campioni mancanti tra il gruppo e il blocco (silenzio scartato, frame persi): il gruppo
+            # deve restare contiguo perche' l'indice ne deriva i tempi, quindi se ne apre uno nuovo
+            expected = self.GroupStartSample + self.GroupEncoder.framesWritten
+            if abs(item["sampleIndex"] - expected) > self.ProcessingRate // 10:
+                print(f"[Processor] Discontinuita' di {(item['sampleIndex'] - expected) / self.ProcessingRate:.1f}s, nuovo gruppo")
+                self.closeGroup()
+
+        if self.GroupEncoder is None:
+            self.openGroup(item)
+
+        started = time.perf_counter()
+        self.GroupBlocks.append((item["startTime"], self.GroupEncoder.framesWritten, len(enhanced), item["sampleIndex"]))
+        self.GroupEncoder.write(enhanced)
+        self.observeStage("encode", time.perf_counter() - started, len(enhanced) / self.ProcessingRate)
+        self.GroupEndTime = item["startTime"] + len(enhanced) / self.ProcessingRate
+        if item["data"] is None:
+            self.FileBlocks.append(item["name"])
+        if item["seq"] is not None:
+            self.GroupLastSeq = item["seq"]
+        self.GroupBlockCount += 1
+
+        # Quando il gruppo raggiunge 20 blocchi (10 minuti)
+        if self.GroupBlockCount == (self.ProcessingTrackDuration / self.SingleTrackDuration):
+            self.closeGroup()
+
+
+
+    def openGroup(self, item):
+        # Il nome file del gruppo usa l'ora reale del primo campione del primo blocco
+        self.GroupStartTime = datetime.fromtimestamp(item["startTime"])
+        self.GroupStartSample = item["sampleIndex"]
+        self.GroupBlockCount = 0
+        self.GroupLastSeq = None
+        self.GroupBlocks = []
+
+        destFolder = os.path.join(self.ProcessedDir, self.GroupStartTime.strftime("%Y%m%d"))
+        Path(destFolder).mkdir(parents=True,exist_ok=True)
+
+        extension = getPreset(self.EncoderPreset)["extension"]
+        groupPath = os.path.join(destFolder, f"group_{self.GroupStartTime.strftime('%Y%m%d_%H%M%S')}.{extension}")
+        self.GroupEncoder = StreamEncoder(groupPath, self.ProcessingRate, preset=self.EncoderPreset).open()
+
+
+
+    def closeGroup(self):
+        print(f"[Processor] Chiusura gruppo da {self.ProcessingTrackDuration / 60} minuti: {self.GroupEncoder.outputPath}")
+        encoder = self.GroupEncoder
+        duration = encoder.framesWritten / self.ProcessingRate
+        groupPath = encoder.close()
+        self.GroupEncoder = None
+        self.EncoderCpu.inc(encoder.cpuSeconds)
+        self.BytesWritten.inc(os.path.getsize(groupPath))
+        print(f"[Processor] Gruppo da 10 minuti salvato: {groupPath}")
+        if self.VAD is not None:
+            stats = self.dayStats({"startTime": self.GroupStartTime.timestamp()})
+            stats["encodedSeconds"] += duration
+            stats["encodedBytes"] += os.path.getsize(groupPath)
+            self.saveDayStats()
+        if duration > 0:
+            hours = duration / 3600
+            print(f"[Processor] Encoder {self.EncoderPreset}: {encoder.cpuSeconds / hours:.0f} CPU-s/ora, "
+                  f"{os.path.getsize(groupPath) / hours / 1e6:.1f} MB/ora")
+            # Durata secondo l'orologio di sistema contro durata in campioni
+            drift = (self.GroupEndTime - self.GroupStartTime.timestamp()) - duration
+            print(f"[Processor] Deriva orologio nel gruppo: {drift * 1000:.1f} ms ({drift / duration * 1e6:.1f} ppm)")
+
+        if self.Packager is not None:
+            try:
+                started = time.perf_counter()
+                segment = self.Packager.appendGroup(groupPath, self.GroupStartTime, duration, recovered=self.Recovering)
+                self.observeStage("package", time.perf_counter() - started, duration)
+                print(f"[Processor] Segmento live aggiunto: {segment}")
+                segmentPath = os.path.join(os.path.dirname(groupPath), segment)
+                self.BytesWritten.inc(os.path.getsize(segmentPath))
+                if self.Index is not None:
+                    self.Index.addSegment(segmentPath, self.GroupStartTime, duration, self.encodedRate(), "hls",
+                                          captureSample=self.GroupStartSample)
+            except Exception as e:
+                print(f"[Processor] Errore nel packaging live di {groupPath}: {e}")
+
+        if self.Index is not None:
+            try:
+                started = time.perf_counter()
+                # Una riga per blocco: offset nel file (alla frequenza dell'encoder) e ora reale di ogni blocco.
+                # Nessun offset in byte: l'm4a e' compresso e il moov e' scritto alla chiusura
+                rate = self.encodedRate()
+                for startTime, offset, frames, captureSample in self.GroupBlocks:
+                    self.Index.addSegment(groupPath, startTime, frames / self.ProcessingRate, rate, "group",
+                                          byteOffset=None, startSample=round(offset * rate / self.ProcessingRate),
+                                          captureSample=captureSample)
+                self.observeStage("index", time.perf_counter() - started, duration)
+            except Exception as e:
+                print(f"[Processor] Errore nell'indicizzazione di {groupPath}: {e}")
+
+        # Pulizia AudioBlocks
+        for f in self.FileBlocks:
+            try:
+                os.remove(f)
+            except:
+                print(f"Impossibile eliminare il file {f}")
+        self.FileBlocks = []
+
+        if self.GroupLastSeq is not None:
+            self.Journal.commit(self.GroupLastSeq, firstSeq=self.JournalFloor)
+            self.GroupLastSeq = None
+
+        self.GroupBlockCount = 0
+
+        # Notifica agli altri stadi (es. orchestrator.py) senza che debbano scandire ProcessedDir
+        for listener in self.GroupListeners:
+            try:
+                listener(self, groupPath, self.GroupStartTime, duration)
+            except Exception as e:
+                print(f"[Processor] Errore nella notifica del gruppo {groupPath}: {e}")
+        return groupPath
+
+
+
+    def encodedRate(self):
+        return getPreset(self.EncoderPreset)["sampleRate"] or self.ProcessingRate
+
+
+
+    def abortGroup(self):
+        """Un encoder fallito non puo' essere ripreso: scarta il gruppo parziale, i blocchi restano su disco/journal"""
+        encoder = self.GroupEncoder
+        if encoder is None or (encoder.process is not None and encoder.process.poll() is None):
+            return
+        encoder.abort()
+        self.GroupEncoder = None
+        self.FileBlocks = []
+        self.GroupBlocks = []
+        self.GroupBlockCount = 0
+        self.GroupLastSeq = None
+
+
+
+    def prepareRecovery(self):
+        """Tracce lasciate dall'esecuzione precedente (riavvio o crash), lette dal solo journal.
+
+        Restano nel journal, senza copie ne' rinomine: quelle sotto JournalFloor sono
+        del recupero e la pipeline live non le libera con i propri commit. I .part dei
+        gruppi interrotti (ffmpeg fermato prima del moov, non leggibili) vengono
+        scartati, il gruppo sara' ricostruito dalle sue tracce."""
+        entries = self.Journal.entries()
+        if not entries:
+            return
+
+        self.JournalFloor = self.Journal.nextSeq
+        startTimes = [self.recoveryItem(entry)["startTime"] for entry in entries]
+        self.RecoveringSince = min(startTimes)
+
+        # Solo le cartelle dei giorni delle tracce da recuperare, non tutto ProcessedDir
+        for day in sorted({datetime.fromtimestamp(t).strftime("%Y%m%d") for t in startTimes}):
+            dayFolder = os.path.join(self.ProcessedDir, day)
+            if not os.path.isdir(dayFolder):
+                continue
+            for name in os.listdir(dayFolder):
+                if name.endswith(".part"):
+                    print(f"[Recovery] Gruppo interrotto scartato: {name}")
+                    os.remove(os.path.join(dayFolder, name))
+
+        print(f"[Recovery] {len(entries)} tracce da recuperare dal {datetime.fromtimestamp(self.RecoveringSince)}")
+
+
+
+    def recoveryItem(self, entry):
+        """Traccia del journal -> elemento del processor, con i tempi originali"""
+        startTime = entry.get("startTime")
+        if startTime is None:
+            # Journal scritto prima dei tempi per traccia: l'ora e' nel nome rec_YYYYMMDD_HHMMSS_stereo.wav
+            startTime = datetime.strptime(os.path.basename(entry["name"])[4:19], "%Y%m%d_%H%M%S").timestamp()
+        sampleIndex = entry.get("sampleIndex")
+        if sampleIndex is None:
+            sampleIndex = round(startTime * self.ProcessingRate)
+        return {"name": entry["name"], "data": None, "seq": entry["seq"], "captured": startTime, "raw": False,
+                "startTime": startTime, "sampleIndex": sampleIndex}
+
+
+
+    def recoveryWorker(self):
+        """Ricostruisce i gruppi interrotti dalle tracce sotto JournalFloor, in ordine di cattura.
+
+        Gira su una copia del recorder con enhancer, VAD ed encoder propri: la pipeline
+        live e' in tempo reale da subito, il recupero ha un costo limitato dal journal
+        (al massimo il gruppo aperto e l'arretrato) e oltre RecoveryEnhanceSeconds di
+        arretrato le tracce piu' vecchie vengono solo amplificate."""
+        try:
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), self.RecoveryNice)
+        except (OSError, AttributeError) as e:
+            print(f"[Recovery] Priorita' del thread non modificata: {e}")
+
+        worker = copy.copy(self)
+        worker.Recovering = True
+        worker.JournalFloor = 0
+        worker.Stats = dict(self.Stats)
+        worker.FileBlocks = []
+        worker.GroupEncoder = None
+        worker.GroupStartTime = None
+        worker.GroupBlockCount = 0
+        worker.GroupLastSeq = None
+        worker.GroupBlocks = []
+        if self.VAD is not None:
+            worker.VAD = VoiceActivityDetector(self.ProcessingRate, marginDb=self.VADMarginDb, minSpeechRatio=self.VADMinSpeechRatio)
+        worker.buildEnhancer()
+
+        entries = [entry for entry in self.Journal.entries() if entry["seq"] < self.JournalFloor]
+        # Ordine di sequenza (= ordine di cattura): i commit del worker liberano tutte le tracce fino all'ultima del gruppo
+        items = [self.recoveryItem(entry) for entry in entries]
+        backlog = sum(entry["frames"] / entry["rate"] if entry["offset"] is not None else self.SingleTrackDuration for entry in entries)
+        rawSeconds = max(0, backlog - self.RecoveryEnhanceSeconds)
+        started = time.monotonic()
+        print(f"[Recovery] Avvio: {len(items)} tracce, {backlog:.0f}s di audio ({rawSeconds:.0f}s senza enhancement)")
+
+        bySeq = {entry["seq"]: entry for entry in entries}
+        failed = 0
+        try:
+            for item in items:
+                entry = bySeq[item["seq"]]
+                duration = entry["frames"] / entry["rate"] if entry["offset"] is not None else self.SingleTrackDuration
+                item["raw"] = rawSeconds > 0
+                rawSeconds -= duration
+                try:
+                    self.RecoveringSince = worker.GroupStartTime.timestamp() if worker.GroupEncoder is not None else item["startTime"]
+                    self.recoverTrack(worker, entry, item, duration)
+                except Exception as e:
+                    failed += 1
+                    print(f"[Recovery] Errore sulla traccia {item['name']}: {e}")
+                    traceback.print_exc()
+
+            # Il gruppo interrotto si chiude qui, piu' corto: il resto della registrazione e' nei gruppi live
+            if worker.GroupEncoder is not None:
+                try:
+                    worker.closeGroup()
+                except Exception as e:
+                    print(f"[Recovery] Errore nella chiusura del gruppo recuperato: {e}")
+                    traceback.print_exc()
+                    worker.abortGroup()
+            # Anche le tracce fallite: riproporle a ogni avvio bloccherebbe il recupero allo stesso punto
+            self.Journal.commit(self.JournalFloor - 1)
+        finally:
+            self.RecoveringSince = None
+        print(f"[Recovery] Completato in {time.monotonic() - started:.1f}s, {failed} tracce non recuperate")
+
+
+
+    def recoverTrack(self, worker, entry, item, duration):
+        # Gia' in un gruppo chiuso e indicizzato (crash tra la chiusura del gruppo e il commit del journal)
+        middle = item["startTime"] + duration / 2
+        if self.Index is not None and self.Index.query(middle, middle + 0.001, kinds=("group",)):
+            self.discardRecovered(item)
+            return
+
+        if entry["offset"] is not None:
+            item["data"] = self.Journal.read(entry)
+        elif not os.path.exists(item["name"]):
+            print(f"[Recovery] Traccia non piu' presente: {item['name']}")
+            return
+
+        worker.processTrack(item)
+        self.RecoveredBlocks.inc()
+        if item["data"] is not None:
+            self.discardRecovered(item)
+
+
+
+    def discardRecovered(self, item):
+        """File lasciati da una traccia recuperata: il WAV (modalita' file) o il FLAC parcheggiato dalla spill"""
+        if item["data"] is None:
+            paths = [item["name"]]
+        else:
+            paths = [os.path.join(self.SpillDir, os.path.splitext(os.path.basename(item["name"]))[0] + ".flac")]
+        for path in paths:
+            if os.path.exists(path):
+                try:
+                    os.remove(path)
+                except OSError:
+                    print(f"Impossibile eliminare il file {path}")
+
+
+
+    def enhancerConfig(self):
+        return {
+            "sampleRate": self.ProcessingRate,
+            "trackFrames": int((self.SingleTrackDuration + self.EnhanceContextSeconds) * self.ProcessingRate),
+            "amplifyDb": self.Amplify_dB,
+            "blockSize": self.DSPBlockSize,
+            "noiseReductionMode": self.NoiseReductionMode,
+            "noiseReductionQuality": self.NoiseReductionQuality,
+            "noiseReductionDecrease": self.NoiseReductionDecrease,
+        }
+
+
+
+    def buildEnhancer(self):
+        """Catena DSP creata una sola volta, con lo stesso stato per blocco dei worker del pool.
+
+        Ogni blocco riparte dalla coda del blocco precedente (EnhanceContextSeconds) invece
+        che dallo stato lasciato dal blocco prima: niente latenza ne' campioni trattenuti
+        tra un blocco e l'altro, e un risultato che non dipende da ProcessingWorkers."""
+        self.Enhancer = AudioEnhancer(streaming=False, **self.enhancerConfig())
+        self.EnhanceContext = None
+        self.EnhanceContextEnd = None
+
+
+
+    def enhancedAudio(self, data, context=None):
+        started = time.perf_counter()
+        if context is None:
+            enhanced = self.Enhancer.process(data)
+        else:
+            # Come _enhanceSlot del pool: contesto in testa, la sua uscita si scarta
+            enhanced = self.Enhancer.process(np.concatenate((context, data)))[len(context):]
+        seconds = len(data) / self.ProcessingRate
+        self.observeStage("enhance", time.perf_counter() - started, seconds)
+        for stage, elapsed in self.Enhancer.lastTimings.items():
+            self.observeStage(stage, elapsed, seconds)
         return enhanced
 
 
 
+    def observeStage(self, stage, elapsed, audioSeconds):
+        histogram, realtimeFactor = self.StageMetrics[stage]
+        histogram.observe(elapsed)
+        self.Profiler.trace(stage, seconds=elapsed, audioSeconds=audioSeconds)
+        if elapsed > 0:
+            realtimeFactor.set(audioSeconds / elapsed)
+
+
+
+    def collectMetrics(self, registry):
+        """Valori tenuti altrove (Stats, stream di cattura, code), letti solo quando si leggono le metriche"""
+        registry.gauge("queue_depth", "Blocks waiting for the processor", self.labels(queue="track")).set(self.TrackFileQueue.qsize())
+        registry.gauge("queue_depth", "Blocks waiting for the processor", self.labels(queue="save")).set(self.SaveQueue.qsize())
+        registry.gauge("queue_depth", "Blocks waiting for the processor", self.labels(queue="spill")).set(len(self.SpillQueue))
+        registry.gauge("lag_seconds", "Delay of the processed block behind real time", self.labels()).set(self.Stats["lagSeconds"])
+        registry.gauge("max_lag_seconds", "Largest processing delay since start", self.labels()).set(self.Stats["maxLagSeconds"])
+        registry.counter("spilled_blocks_total", "Blocks parked on disk by the overload policy", self.labels()).set(self.Stats["spilledBlocks"])
+        registry.counter("raw_blocks_total", "Blocks saved without enhancement by the overload policy", self.labels()).set(self.Stats["rawBlocks"])
+
+        stream = self.i2sDev.streamStats()
+        if stream:
+            registry.counter("capture_overflows_total", "PortAudio input overflows", self.labels()).set(stream["overflows"])
+            registry.counter("capture_dropped_frames_total", "Frames dropped by the full ring buffer", self.labels()).set(stream["droppedFrames"])
+            registry.counter("capture_frames_total", "Frames captured by the stream callback", self.labels()).set(stream["capturedFrames"])
+            registry.counter("capture_callbacks_total", "Stream callbacks", self.labels()).set(stream["callbacks"])
+            registry.gauge("capture_buffered_frames", "Frames waiting in the ring buffer", self.labels()).set(stream["bufferedFrames"])
+            registry.gauge("clock_drift_seconds", "Audio clock drift against the system clock", self.labels()).set(stream["clockDriftSeconds"])
+            registry.gauge("clock_drift_ppm", "Audio clock drift against the system clock, ppm", self.labels()).set(stream["clockDriftPpm"])
+
+
+
+    def silentAudio(self, data):
+        """Blocco senza voce: salta la catena DSP ma resta solo amplificato, non azzerato.
+
+        Un blocco sotto VADMinSpeechRatio puo' contenere una parola breve: il silenzio
+        digitale la cancellerebbe dall'archivio."""
+        return self.rawAudio(data)
+
+
+
+    def rawAudio(self, data):
+        """Fallback in sovraccarico: solo amplificazione, nessuna riduzione rumore o equalizzazione"""
+        return np.clip(data * self.AmplifyFactor, -1.0, 1.0).astype(np.float32)
+
+
+
 
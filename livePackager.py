@@ -0,0 +1,171 @@
+import os
+import math
+import threading
+import subprocess
+from datetime import datetime
+
+
+
+class LiveHLSPackager:
+    """Playlist HLS della giornata aggiornata ad ogni gruppo da 10 minuti.
+
+    Ogni gruppo m4a viene rimappato (-c copy) in un segmento segments/chunk-NNN.ts
+    nella cartella del giorno e aggiunto a YYYYMMDD.m3u8 come playlist EVENT; quando
+    inizia un nuovo giorno la playlist precedente viene chiusa come VOD. Il layout
+    e' lo stesso prodotto da copyCloud, che quindi puo' caricarla senza rielaborarla.
+    I gruppi ricostruiti dal recupero dopo un crash arrivano in ritardo: vengono
+    accodati come gli altri, anche in una playlist gia' chiusa, mai riordinati
+    (una playlist EVENT puo' solo crescere in coda). I timestamp dei segmenti
+    proseguono da uno all'altro (-output_ts_offset della durata precedente); ogni
+    segmento che non segue il precedente nel tempo reale e' preceduto da
+    EXT-X-DISCONTINUITY, e EXT-X-PROGRAM-DATE-TIME porta lo scostamento da UTC."""
+
+    processedDir:str
+    targetDuration:int
+    ContinuityTolerance:float = 1.0  # secondi tra la fine di un segmento e l'inizio del successivo
+
+    days:dict
+    lock:threading.RLock
+
+
+
+    def __init__(self, processedDir:str, targetDuration:int=600):
+        self.processedDir = processedDir
+        self.targetDuration = targetDuration
+        self.days = {}
+        # appendGroup gira nel thread di processing, finalizeDay anche dall'orchestrator
+        self.lock = threading.RLock()
+        self.finalizePastDays()
+
+
+
+    def playlistPath(self, day:str):
+        return os.path.join(self.processedDir, day, f"{day}.m3u8")
+
+
+
+    def loadDay(self, day:str):
+        """Segmenti gia' presenti nella playlist del giorno (ripresa dopo un riavvio)"""
+        if day in self.days:
+            return self.days[day]
+
+        state = {"segments": [], "closed": False}
+        path = self.playlistPath(day)
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                lines = [line.strip() for line in f]
+            dateTime = None
+            duration = None
+            discontinuity = False
+            for line in lines:
+                if line.startswith("#EXT-X-PROGRAM-DATE-TIME:"):
+                    # Playlist scritte senza fuso: ora locale, a cui si aggiunge lo scostamento
+                    dateTime = datetime.fromisoformat(line.split(":", 1)[1]).astimezone().isoformat(timespec="milliseconds")
+                elif line == "#EXT-X-DISCONTINUITY":
+                    discontinuity = True
+                elif line.startswith("#EXTINF:"):
+                    duration = float(line[len("#EXTINF:"):].rstrip(","))
+                elif line and not line.startswith("#"):
+                    state["segments"].append({"uri": line, "duration": duration, "start": dateTime, "discontinuity": discontinuity})
+                    dateTime = None
+                    discontinuity = False
+            state["closed"] = "#EXT-X-ENDLIST" in lines
+        self.days[day] = state
+        return state
+
+
+
+    def appendGroup(self, groupPath:str, startTime:datetime, duration:float, recovered:bool=False):
+        with self.lock:
+            day = startTime.strftime("%Y%m%d")
+            if not recovered:
+                for pastDay in [d for d in self.days if d < day and not self.days[d]["closed"]]:
+                    self.finalizeDay(pastDay)
+
+            state = self.loadDay(day)
+            if state["closed"] and not recovered:
+                raise RuntimeError(f"Playlist {self.playlistPath(day)} already finalized, segment {groupPath} not added")
+
+            dayFolder = os.path.join(self.processedDir, day)
+            os.makedirs(os.path.join(dayFolder, "segments"), exist_ok=True)
+            uri = f"segments/chunk-{len(state['segments']):03d}.ts"
+            # Ogni gruppo ripartirebbe da PTS 0: lo spostamento della durata gia' in playlist tiene i tempi crescenti.
+            # Senza avoid_negative_ts il primo segmento (spostamento 0) verrebbe traslato diversamente dagli altri
+            tsOffset = sum(segment["duration"] for segment in state["segments"])
+
+            cmd = [
+                "ffmpeg", "-y", "-nostdin", "-loglevel", "error",
+                "-i", groupPath,
+                "-c", "copy",
+                "-avoid_negative_ts", "disabled",
+                "-output_ts_offset", f"{tsOffset:.6f}",
+                "-f", "mpegts",
+                os.path.join(dayFolder, uri)
+            ]
+            result = subprocess.run(cmd, capture_output=True, text=True)
+            if result.returncode != 0:
+                raise RuntimeError(f"ffmpeg exit code {result.returncode} packaging {groupPath}: {result.stderr.strip()}")
+
+            start = startTime.astimezone()
+            state["segments"].append({"uri": uri, "duration": duration, "start": start.isoformat(timespec="milliseconds"),
+                                      "discontinuity": not self.follows(state["segments"], start)})
+            self.writePlaylist(day)
+            return uri
+
+
+
+    def follows(self, segments:list, start:datetime):
+        """True se un segmento che inizia a start prosegue l'ultimo della playlist senza salti"""
+        if not segments or not segments[-1]["start"]:
+            return True
+        last = segments[-1]
+        expected = datetime.fromisoformat(last["start"]).timestamp() + last["duration"]
+        return abs(start.timestamp() - expected) <= self.ContinuityTolerance
+
+
+
+    def finalizeDay(self, day:str):
+        with self.lock:
+            state = self.loadDay(day)
+            if state["closed"] or not state["segments"]:
+                return
+            state["closed"] = True
+            self.writePlaylist(day)
+            print(f"[Packager] Playlist {self.playlistPath(day)} chiusa come VOD")
+
+
+
+    def finalizePastDays(self):
+        if not os.path.isdir(self.processedDir):
+            return
+        today = datetime.now().strftime("%Y%m%d")
+        for name in sorted(os.listdir(self.processedDir)):
+            if name.isdigit() and len(name) == 8 and name < today and os.path.exists(self.playlistPath(name)):
+                self.finalizeDay(name)
+
+
+
+    def writePlaylist(self, day:str):
+        state = self.days[day]
+        lines = [
+            "#EXTM3U",
+            "#EXT-X-VERSION:3",
+            f"#EXT-X-PLAYLIST-TYPE:{'VOD' if state['closed'] else 'EVENT'}",
+            f"#EXT-X-TARGETDURATION:{max([self.targetDuration] + [math.ceil(s['duration']) for s in state['segments']])}",
+            "#EXT-X-MEDIA-SEQUENCE:0",
+        ]
+        for segment in state["segments"]:
+            if segment.get("discontinuity"):
+                lines.append("#EXT-X-DISCONTINUITY")
+            if segment["start"]:
+                lines.append(f"#EXT-X-PROGRAM-DATE-TIME:{segment['start']}")
+            lines.append(f"#EXTINF:{segment['duration']:.3f},")
+            lines.append(segment["uri"])
+        if state["closed"]:
+            lines.append("#EXT-X-ENDLIST")
+
+        # Sostituzione atomica: un player non legge mai una playlist scritta a meta'
+        path = self.playlistPath(day)
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(path + ".tmp", path)
@@ -0,0 +1,171 @@
+import os
+import json
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+
+class CloudSync:
+    """Sincronizzazione incrementale di una cartella locale verso il cloud.
+
+    Il manifest locale registra dimensione, mtime e sha256 di ogni file gia'
+    caricato e verificato: ai giri successivi si copiano solo i file nuovi o
+    cambiati. Le copie sono a blocchi (hash calcolato durante la lettura), in
+    parallelo, su un file temporaneo rinominato solo a copia completata. La
+    destinazione e' un semplice percorso, quindi una cartella locale qualsiasi
+    puo' prendere il posto del mount rclone."""
+
+    localDir:str
+    remoteDir:str
+    manifestPath:str
+    workers:int
+    chunkSize:int
+    verifyHash:bool
+    exclude:set
+
+    manifest:dict
+    lock:threading.Lock
+
+
+
+    def __init__(self, localDir:str, remoteDir:str, manifestPath:str, workers:int=4, chunkSize:int=1024 * 1024, verifyHash:bool=True, exclude=()):
+        self.localDir = localDir
+        self.remoteDir = remoteDir
+        self.manifestPath = manifestPath
+        self.workers = workers
+        self.chunkSize = chunkSize
+        self.verifyHash = verifyHash
+        self.exclude = set(exclude)
+        self.lock = threading.Lock()
+        self.manifest = self.loadManifest()
+
+
+
+    def loadManifest(self):
+        if not os.path.exists(self.manifestPath):
+            return {}
+        try:
+            with open(self.manifestPath, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except ValueError:
+            return {}
+
+
+
+    def saveManifest(self):
+        os.makedirs(os.path.dirname(self.manifestPath) or ".", exist_ok=True)
+        with open(self.manifestPath + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(self.manifest, f, indent=1, sort_keys=True)
+        os.replace(self.manifestPath + ".tmp", self.manifestPath)
+
+
+
+    def localFiles(self):
+        files = []
+        for root, _, names in os.walk(self.localDir):
+            for name in names:
+                if name in self.exclude:
+                    continue
+                files.append(os.path.relpath(os.path.join(root, name), self.localDir))
+        files.sort()
+        return files
+
+
+
+    def fileHash(self, path:str):
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(self.chunkSize), b""):
+                digest.update(block)
+        return digest.hexdigest()
+
+
+
+    def needsUpload(self, rel:str):
+        entry = self.manifest.get(rel)
+        if entry is None:
+            return True
+        stat = os.stat(os.path.join(self.localDir, rel))
+        if entry["size"] == stat.st_size and entry["mtime"] == stat.st_mtime:
+            return False
+        if entry["size"] != stat.st_size:
+            return True
+        # Stessa dimensione ma mtime diverso: decide il contenuto
+        return self.fileHash(os.path.join(self.localDir, rel)) != entry["sha256"]
+
+
+
+    def copyFile(self, rel:str):
+        source = os.path.join(self.localDir, rel)
+        target = os.path.join(self.remoteDir, rel)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        stat = os.stat(source)
+
+        tmpTarget = target + ".part"
+        digest = hashlib.sha256()
+        with open(source, "rb") as src, open(tmpTarget, "wb") as dst:
+            for block in iter(lambda: src.read(self.chunkSize), b""):
+                digest.update(block)
+                dst.write(block)
+        os.replace(tmpTarget, target)
+
+        entry = {"size": stat.st_size, "mtime": stat.st_mtime, "sha256": digest.hexdigest()}
+        self.verifyFile(rel, entry)
+
+        with self.lock:
+            self.manifest[rel] = entry
+            self.saveManifest()
+        return stat.st_size
+
+
+
+    def verifyFile(self, rel:str, entry:dict):
+        target = os.path.join(self.remoteDir, rel)
+        if not os.path.exists(target) or os.path.getsize(target) != entry["size"]:
+            raise IOError(f"Remote size mismatch for {rel}")
+        if self.verifyHash and self.fileHash(target) != entry["sha256"]:
+            raise IOError(f"Remote checksum mismatch for {rel}")
+
+
+
+    def sync(self):
+        """Copia i file nuovi o cambiati, ritorna il report del giro"""
+        files = self.localFiles()
+        pending = [rel for rel in files if self.needsUpload(rel)]
+        report = {"files": len(files), "uploaded": 0, "skipped": len(files) - len(pending), "bytes": 0, "failed": []}
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            futures = {executor.submit(self.copyFile, rel): rel for rel in pending}
+            for future, rel in futures.items():
+                try:
+                    report["bytes"] += future.result()
+                    report["uploaded"] += 1
+                except Exception as e:
+                    print(f"Upload of {rel} failed: {e}")
+                    report["failed"].append(rel)
+
+        report["verified"] = not report["failed"] and self.isComplete(files)
+        return report
+
+
+
+    def isComplete(self, files=None):
+        """Tutti i file locali risultano caricati e il remoto ha ancora lo stesso contenuto.
+
+        Il manifest non basta: ogni file viene riverificato sul remoto, e quello
+        che non passa la verifica esce dal manifest per essere ricaricato."""
+        complete = True
+        for rel in files if files is not None else self.localFiles():
+            if self.needsUpload(rel):
+                complete = False
+                continue
+            try:
+                self.verifyFile(rel, self.manifest[rel])
+            except OSError as e:
+                print(f"Verification of {rel} failed: {e}")
+                with self.lock:
+                    del self.manifest[rel]
+                    self.saveManifest()
+                complete = False
+        return complete
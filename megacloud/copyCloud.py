@@ -1,10 +1,16 @@
 import os
+import json
 import shutil
 import pathlib
+import time
+import threading
 import subprocess
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 import traceback
 
+from cloudSync import CloudSync
+
 
 
 class HLSCopyCloud:
@@ -15,6 +21,18 @@ class HLSCopyCloud:
 
     CLOUD_DIR = "/aurigalab/megacloud/iRec"
 
+    # Recupero arretrati: giorni elaborati in parallelo, con limiti separati per
+    # i passi che leggono/scrivono il disco locale (ffmpeg) e per le copie verso il cloud
+    WORKERS = 2
+    DISK_SLOTS = 1
+    UPLOAD_SLOTS = 2
+
+    CHECKPOINT_NAME = ".copycloud_checkpoint.json"
+
+    # Manifest di cio' che e' gia' nel cloud, uno per giorno (restano anche dopo la rimozione locale)
+    MANIFEST_DIR = os.path.join(BASEDIR, "megacloud", "manifests")
+    UPLOAD_CHUNK_SIZE = 4 * 1024 * 1024
+
     subFolders = []
 
     today = None 
@@ -25,6 +43,18 @@ class HLSCopyCloud:
     def __init__(self):
         try:
             self.today = datetime.now().strftime("%Y%m%d")
+            self.diskSlots = threading.Semaphore(self.DISK_SLOTS)
+            self.uploadSlots = threading.Semaphore(self.UPLOAD_SLOTS)
+        except:
+            print(traceback.format_exc())
+
+
+
+
+
+    def run(self):
+        # Esecuzione da cron: tutte le cartelle dei giorni passati in PROCESSED_AUDIO_DIR
+        try:
             self.subFolders = [ f.path for f in os.scandir(self.PROCESSED_AUDIO_DIR) if f.is_dir() ]
             self.checkValidFolders()
         except:
@@ -35,42 +65,118 @@ class HLSCopyCloud:
 
 
     def checkValidFolders(self):
+        folders = []
         for d in self.subFolders:
-            audioPath = pathlib.PurePath(d)
-            folderName = audioPath.name
-            if(folderName != self.today):
+            if pathlib.PurePath(d).name != self.today:
+                folders.append(d)
+            else:
+                print(f"Folder {d} is not processable, continue...")
+        folders.sort()
 
-                cloudFolderPath = os.path.join(self.CLOUD_DIR, folderName)
-                if os.path.exists(cloudFolderPath):
-                    print(f"Preparing {cloudFolderPath} ...")
-                    shutil.rmtree(cloudFolderPath)
-                os.mkdir(cloudFolderPath)
+        if self.WORKERS <= 1:
+            for d in folders:
+                self.processFolder(d)
+        else:
+            with ThreadPoolExecutor(max_workers=self.WORKERS) as executor:
+                list(executor.map(self.processFolder, folders))
 
-                try:
+
+
+
+    def processFolder(self, d, cloudName=None):
+        # cloudName: percorso relativo nel cloud (es. sorgente/YYYYMMDD con piu' sorgenti), di default il nome della cartella
+        audioPath = pathlib.PurePath(d)
+        folderName = audioPath.name
+        cloudName = cloudName or folderName
+        cloudFolderPath = os.path.join(self.CLOUD_DIR, cloudName)
+
+        # Ripresa dopo un'interruzione: i passi gia' completati non vengono ripetuti
+        checkpoint = self.loadCheckpoint(d)
+
+        try:
+            if not checkpoint.get("rewrapped"):
+                if self.isLivePackaged(d, folderName):
+                    print(f"HLS {folderName} already packaged live, skipping remapping ...")
+                else:
                     print(f"Rempapping {d} ...")
-                    self.reWrappingAudioFolder(audioPath, folderName)
+                    with self.diskSlots:
+                        self.reWrappingAudioFolder(audioPath, folderName)
+                checkpoint["rewrapped"] = True
+                self.saveCheckpoint(d, checkpoint)
+
+            if not checkpoint.get("copied"):
+                print(f"Syncing HLS {folderName} to Cloud ...")
+                sync = CloudSync(
+                    d, cloudFolderPath,
+                    manifestPath=os.path.join(self.MANIFEST_DIR, f"{cloudName.replace(os.sep, '_')}.json"),
+                    workers=self.UPLOAD_SLOTS,
+                    chunkSize=self.UPLOAD_CHUNK_SIZE,
+                    exclude=(self.CHECKPOINT_NAME, self.CHECKPOINT_NAME + ".tmp"))
+                with self.uploadSlots:
+                    report = sync.sync()
+                print(f"Uploaded {report['uploaded']} files ({report['bytes']} bytes), {report['skipped']} already in Cloud")
+
+                # La cartella locale si cancella solo se ogni file e' verificato nel cloud
+                if not report["verified"]:
+                    print(f"Sync of {folderName} not verified, failed files: {report['failed']}; keeping {d}")
+                    return
+                checkpoint["copied"] = True
+                self.saveCheckpoint(d, checkpoint)
+
+            print(f"Removing {d} ...")
+            shutil.rmtree(d)
+        except:
+            print(f"Error on copy {d} on {cloudFolderPath}")
+            print(traceback.format_exc())
+
+
+
+
+    def loadCheckpoint(self, audioFolder):
+        checkpointPath = os.path.join(audioFolder, self.CHECKPOINT_NAME)
+        if not os.path.exists(checkpointPath):
+            return {}
+        try:
+            with open(checkpointPath, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except ValueError:
+            return {}
+
+
+
+
+    def saveCheckpoint(self, audioFolder, checkpoint):
+        checkpointPath = os.path.join(audioFolder, self.CHECKPOINT_NAME)
+        with open(checkpointPath + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(checkpoint, f)
+        os.replace(checkpointPath + ".tmp", checkpointPath)
 
-                    print(f"Copying HLS {folderName} to Cloud ...")
-                    shutil.copytree(d, cloudFolderPath, dirs_exist_ok=True)
-                    print(f"Removing {d} ...")
-                    shutil.rmtree(d)
-                except:
-                    print(f"Error on copy {d} on {cloudFolderPath}")
-                    print(traceback.format_exc())
-            else:
-                print(f"Folder {d} is not processable, continue...")
 
 
 
+    def isLivePackaged(self, audioFolder, folderName):
+        # Playlist scritta dal LiveHLSPackager del recorder e chiusa come VOD a fine giornata
+        m3u8Path = os.path.join(audioFolder, f"{folderName}.m3u8")
+        if not os.path.exists(m3u8Path):
+            return False
+        with open(m3u8Path, "r", encoding="utf-8") as f:
+            return "#EXT-X-ENDLIST" in f.read()
+
 
 
 
     def reWrappingAudioFolder(self, audioFolder, folderName):
+        started = time.monotonic()
         audioFolderPath = pathlib.Path(audioFolder)
         files = sorted(audioFolderPath.glob("*.m4a"))
+        if not files:
+            raise RuntimeError(f"No m4a files in {audioFolder}")
+
+        print(f"Preparing Segments Path ...")
         segmentPath = os.path.join(audioFolder, "segments")
-        if not os.path.exists(segmentPath):
-            os.mkdir(segmentPath)
+        if os.path.exists(segmentPath):
+            shutil.rmtree(segmentPath)
+        os.mkdir(segmentPath)
 
         print("Creation list file input.txt...")
         inputTXTPath = os.path.join(audioFolder, "input.txt")
@@ -78,75 +184,54 @@ class HLSCopyCloud:
             for filename in files:
                 f.write(f"file '{filename.name}'\n")
 
-        print("Joining m4a files...")
-        joinFileName = "output.m4a"
+        # Un solo passaggio: concat dei gruppi -> segmenti HLS, con il prefisso segments/ gia' nella playlist
+        print("Creating Streaming HLS...")
+        m3u8Name = f"{folderName}.m3u8"
         cmd = [
-            "ffmpeg",
+            "ffmpeg", "-y", "-nostdin",
+            "-loglevel", "error",
             "-f", "concat",
             "-safe", "0",
             "-i", "input.txt",
             "-c", "copy",
-            joinFileName
-        ]
-        result = subprocess.run(cmd, cwd=audioFolder, capture_output=True, text=True)
-
-        print(f"Preparing Segments Path ...")
-        segmentPath = os.path.join(audioFolder, "segments")
-        if os.path.exists(segmentPath):
-            shutil.rmtree(segmentPath)
-        os.mkdir(segmentPath)
-
-        print("Creating Streaming HLS...")
-        cmd = [
-            "ffmpeg",
-            "-i", "output.m4a",
-            "-c", "copy",
+            "-f", "hls",
             "-hls_time", "600",
             "-hls_playlist_type", "vod",
             "-hls_segment_filename", "segments/chunk-%03d.ts",
-            f"{folderName}.m3u8"
+            "-hls_base_url", "segments/",
+            m3u8Name
         ]
-        result = subprocess.run(cmd, cwd=audioFolder, capture_output=True, text=True)
-        
-        self.regenerateM3u8(audioFolder, folderName)
-        self.cleanGarbage(audioFolder)
-
-
-
-
-    def cleanGarbage(self, audioFolder):
-        # audioFolderPath = pathlib.Path(audioFolder)
-
-        '''
-        for filename in audioFolderPath.glob(f"*.m4a"):
-            try:
-                filename.unlink()
-            except:
-                print(f"File {filename} not removed, you should remove it manually.")
-        '''
-
-        inputTXTPath = os.path.join(audioFolder, "input.txt")
-        if os.path.exists(inputTXTPath):
-            try:
-                pathlib.Path(inputTXTPath).unlink()
-            except:
-                print(f"File {inputTXTPath} not removed.")
-
+        try:
+            result = subprocess.run(cmd, cwd=audioFolder, capture_output=True, text=True)
+            if result.returncode != 0:
+                # Niente upload ne' cancellazione della sorgente se la playlist non e' completa
+                shutil.rmtree(segmentPath, ignore_errors=True)
+                m3u8Path = os.path.join(audioFolder, m3u8Name)
+                if os.path.exists(m3u8Path):
+                    os.remove(m3u8Path)
+                raise RuntimeError(f"ffmpeg exit code {result.returncode} on {audioFolder}: {result.stderr.strip()}")
+        finally:
+            self.cleanGarbage(audioFolder)
 
+        bytesWritten = os.path.getsize(os.path.join(audioFolder, m3u8Name))
+        for segment in pathlib.Path(segmentPath).iterdir():
+            bytesWritten += segment.stat().st_size
+        print(f"HLS {folderName}: {len(files)} files in {time.monotonic() - started:.1f}s, {bytesWritten} bytes written")
+        return {"folder": folderName, "files": len(files), "wall_seconds": time.monotonic() - started, "bytes_written": bytesWritten}
 
 
-    def regenerateM3u8(self, audioFolder, folderName):
-        m3u8Path = os.path.join(audioFolder, f"{folderName}.m3u8")
 
-        with open(m3u8Path, "r", encoding="utf-8") as f:
-            lines = f.readlines()
 
-        with open(m3u8Path, "w", encoding="utf-8") as f:
-            for line in lines:
-                # Se la riga NON è un commento e contiene "chunk-", aggiungi "segments/" davanti
-                if not line.startswith("#") and "chunk-" in line and not line.startswith("segments/"):
-                    line = "segments/" + line
-                f.write(line)            
+    def cleanGarbage(self, audioFolder):
+        # input.txt del concat e l'eventuale output.m4a lasciato dalla vecchia versione a due passaggi
+        for name in ("input.txt", "output.m4a"):
+            garbagePath = os.path.join(audioFolder, name)
+            if os.path.exists(garbagePath):
+                try:
+                    pathlib.Path(garbagePath).unlink()
+                except:
+                    print(f"File {garbagePath} not removed.")
 
 
-foo = HLSCopyCloud()
\ No newline at end of file
+if __name__ == "__main__":
+    HLSCopyCloud().run()
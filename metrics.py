@@ -0,0 +1,243 @@
+import os
+import json
+import time
+import bisect
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+
+class Counter:
+    """Valore che cresce soltanto (campioni, byte, overflow...)"""
+
+    kind = "counter"
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount:float=1):
+        self.value += amount
+
+    def set(self, value:float):
+        # Per i contatori tenuti altrove (es. overflow di PortAudio) e letti dai collector
+        self.value = value
+
+    def samples(self, name:str, labels:dict):
+        return [(name, labels, self.value)]
+
+
+
+class Gauge:
+    """Valore istantaneo (profondita' delle code, ritardo, real-time factor...)"""
+
+    kind = "gauge"
+
+    def __init__(self):
+        self.value = 0.0
+
+    def set(self, value:float):
+        self.value = value
+
+    def samples(self, name:str, labels:dict):
+        return [(name, labels, self.value)]
+
+
+
+class Histogram:
+    """Distribuzione a bucket fissi: observe() e' una bisect e due somme, senza lock"""
+
+    kind = "histogram"
+
+    DefaultBuckets = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+    def __init__(self, buckets=DefaultBuckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value:float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def time(self):
+        return HistogramTimer(self)
+
+    def samples(self, name:str, labels:dict):
+        samples = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            cumulative += count
+            le = "+Inf" if bound == float("inf") else repr(bound)
+            samples.append((name + "_bucket", dict(labels, le=le), cumulative))
+        samples.append((name + "_sum", labels, self.sum))
+        samples.append((name + "_count", labels, self.count))
+        return samples
+
+
+
+class HistogramTimer:
+
+    def __init__(self, histogram:Histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.elapsed = time.perf_counter() - self.started
+        self.histogram.observe(self.elapsed)
+
+
+
+class MetricsRegistry:
+    """Registro delle metriche del recorder.
+
+    Il percorso caldo aggiorna solo attributi di oggetti gia' creati; i valori che
+    vivono altrove (Stats, statistiche dello stream, CPU dei thread) vengono letti
+    dai collector solo quando qualcuno legge le metriche, via HTTP in formato
+    Prometheus o con lo snapshot JSON periodico."""
+
+    metrics:dict
+    help:dict
+    collectors:list
+    lock:threading.Lock
+
+    server:ThreadingHTTPServer = None
+
+
+
+    def __init__(self, prefix:str="recorder"):
+        self.prefix = prefix
+        self.metrics = {}
+        self.help = {}
+        self.collectors = []
+        self.lock = threading.Lock()
+
+
+
+    def __metric(self, cls, name:str, help:str, labels:dict, **kwargs):
+        name = f"{self.prefix}_{name}"
+        key = (name, tuple(sorted((labels or {}).items())))
+        metric = self.metrics.get(key)
+        if metric is None:
+            with self.lock:
+                metric = self.metrics.setdefault(key, cls(**kwargs))
+                self.help.setdefault(name, (help, cls.kind))
+        return metric
+
+
+
+    def counter(self, name:str, help:str="", labels:dict=None):
+        return self.__metric(Counter, name, help, labels)
+
+
+
+    def gauge(self, name:str, help:str="", labels:dict=None):
+        return self.__metric(Gauge, name, help, labels)
+
+
+
+    def histogram(self, name:str, help:str="", labels:dict=None, buckets=Histogram.DefaultBuckets):
+        return self.__metric(Histogram, name, help, labels, buckets=buckets)
+
+
+
+    def addCollector(self, collector):
+        """collector(registry) viene chiamato prima di ogni lettura delle metriche"""
+        self.collectors.append(collector)
+
+
+
+    def collect(self):
+        for collector in self.collectors:
+            try:
+                collector(self)
+            except Exception as e:
+                print(f"[Metrics] Errore nel collector {collector}: {e}")
+        with self.lock:
+            return list(self.metrics.items())
+
+
+
+    def render(self):
+        """Formato testuale di esposizione Prometheus"""
+        lines = []
+        lastName = None
+        for (name, labels), metric in sorted(self.collect(), key=lambda m: m[0]):
+            if name != lastName:
+                help, kind = self.help[name]
+                lines.append(f"# HELP {name} {help}")
+                lines.append(f"# TYPE {name} {kind}")
+                lastName = name
+            for sampleName, sampleLabels, value in metric.samples(name, dict(labels)):
+                labelText = ",".join(f'{k}="{v}"' for k, v in sampleLabels.items())
+                lines.append(f"{sampleName}{{{labelText}}} {value}" if labelText else f"{sampleName} {value}")
+        return "\n".join(lines) + "\n"
+
+
+
+    def snapshot(self):
+        metrics = []
+        for (name, labels), metric in self.collect():
+            entry = {"name": name, "type": metric.kind, "labels": dict(labels)}
+            if isinstance(metric, Histogram):
+                entry.update(count=metric.count, sum=metric.sum, buckets=dict(zip(map(str, metric.buckets), metric.counts)))
+            else:
+                entry["value"] = metric.value
+            metrics.append(entry)
+        return {"time": time.time(), "metrics": metrics}
+
+
+
+    def serve(self, port:int, host:str="127.0.0.1"):
+        """Endpoint HTTP locale con le metriche in formato Prometheus (GET /metrics)"""
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] not in ("/", "/metrics"):
+                    self.send_error(404)
+                    return
+                body = registry.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=self.server.serve_forever, name="MetricsServer", daemon=True).start()
+        print(f"[Metrics] Endpoint Prometheus su http://{host}:{port}/metrics")
+
+
+
+    def startSnapshots(self, path:str, interval:float=30):
+        """Scrive periodicamente lo snapshot JSON (sostituzione atomica)"""
+        def snapshotWorker():
+            while True:
+                time.sleep(interval)
+                try:
+                    with open(path + ".tmp", "w", encoding="utf-8") as f:
+                        json.dump(self.snapshot(), f)
+                    os.replace(path + ".tmp", path)
+                except Exception as e:
+                    print(f"[Metrics] Errore nello snapshot {path}: {e}")
+
+        threading.Thread(target=snapshotWorker, name="MetricsSnapshot", daemon=True).start()
+
+
+
+def threadCpuCollector(registry:MetricsRegistry):
+    """CPU consumata da ogni thread del processo, letta dal clock per-thread del kernel"""
+    for thread in threading.enumerate():
+        try:
+            cpu = time.clock_gettime(time.pthread_getcpuclockid(thread.ident))
+        except (OSError, AttributeError, TypeError):
+            continue
+        registry.counter("thread_cpu_seconds_total", "CPU time per thread", {"thread": thread.name}).set(cpu)
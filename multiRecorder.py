@@ -0,0 +1,213 @@
+import os
+import time
+import queue
+import threading
+import traceback
+
+from i2sDevice import i2sDevice
+from i2sRecorder import i2sRecorder
+from enhancePool import EnhancePool
+from metrics import MetricsRegistry, threadCpuCollector
+from profiler import Profiler
+
+
+
+class ChannelSource:
+    """Un canale di un device condiviso, con l'interfaccia di i2sDevice usata da i2sRecorder.
+
+    Il DeviceReader legge ogni blocco una volta sola e passa a ogni sorgente
+    una vista sul suo canale (nessuna copia); captureStream la restituisce
+    insieme all'ora reale e all'indice del primo campione del blocco."""
+
+    deviceReady:bool = True
+    device:i2sDevice
+    channel:int
+    blocks:queue.Queue
+
+    lastCaptureTime:float = None
+    lastCaptureSample:int = 0
+
+
+
+    def __init__(self, device:i2sDevice, channel:int, maxBlocks:int):
+        self.device = device
+        self.channel = channel
+        # Stessa capacita' del ring buffer: una sorgente in ritardo rallenta il lettore come farebbe il ring
+        self.blocks = queue.Queue(maxsize=maxBlocks)
+
+
+
+    def push(self, view, startTime:float, sampleIndex:int):
+        self.blocks.put((view, startTime, sampleIndex))
+
+
+
+    def startStream(self, bufferSeconds:int=120, blocksize:int=0):
+        # Lo stream del device e' aperto dal DeviceReader
+        pass
+
+
+
+    def captureStream(self, duration:int):
+        view, self.lastCaptureTime, self.lastCaptureSample = self.blocks.get()
+        return view
+
+
+
+    def streamStats(self):
+        return self.device.streamStats()
+
+
+
+    def clockDrift(self):
+        return self.device.clockDrift()
+
+
+
+class DeviceReader:
+    """Thread di cattura di un device fisico: un blocco multi-canale, una vista per sorgente"""
+
+    device:i2sDevice
+    sources:list
+    blockSeconds:int
+    bufferSeconds:int
+
+
+
+    def __init__(self, device:i2sDevice, blockSeconds:int, bufferSeconds:int):
+        self.device = device
+        self.sources = []
+        self.blockSeconds = blockSeconds
+        self.bufferSeconds = bufferSeconds
+
+
+
+    def addSource(self, channel:int):
+        source = ChannelSource(self.device, channel, max(1, self.bufferSeconds // self.blockSeconds))
+        self.sources.append(source)
+        return source
+
+
+
+    def start(self):
+        threading.Thread(target=self.readWorker, name=f"Capture-{self.device.deviceSearchingTerm}", daemon=True).start()
+
+
+
+    def readWorker(self):
+        self.device.startStream(bufferSeconds=self.bufferSeconds)
+        while True:
+            try:
+                block = self.device.captureStream(duration=self.blockSeconds)
+                startTime = self.device.lastCaptureTime
+                sampleIndex = self.device.lastCaptureSample
+                for source in self.sources:
+                    view = block[:, source.channel] if block.ndim > 1 else block
+                    source.push(view, startTime, sampleIndex)
+            except Exception as e:
+                print(f"[Capture] Errore sul device {self.device.deviceSearchingTerm}: {e}")
+                traceback.print_exc()
+                time.sleep(1)
+
+
+
+class MultiSourceRecorder:
+    """Piu' stanze su un solo Raspberry: N device e/o M canali, ognuno una sorgente con nome.
+
+    Ogni sorgente e' un i2sRecorder con il suo albero di output
+    (AudioTracksDir/<nome>, ProcessedDir/<nome>: gruppi, playlist, indice) e il suo
+    stato (gruppo corrente, journal, VAD, catena DSP in streaming); il pool di
+    processi per l'enhancement, le metriche e il profiler sono condivisi. Ogni
+    device fisico viene letto da un solo thread, i canali arrivano alle sorgenti
+    come viste numpy sullo stesso blocco."""
+
+    # name: sottocartella di output ed etichetta delle metriche; device: termine di ricerca del device; channel: indice del canale
+    Sources = [
+        {"name": "room1", "device": "googlevoicehat", "channel": 0},
+        {"name": "room2", "device": "googlevoicehat", "channel": 1},
+    ]
+
+    # Configurazione comune a tutte le sorgenti (frequenze, DSP, preset, politiche): quella di i2sRecorder
+    RecorderClass = i2sRecorder
+
+    AudioTracksDir:str = "audio_logs"
+    ProcessedDir:str = "processed_audio"
+
+    readers:dict
+    recorders:list
+    Pool:EnhancePool = None
+    Metrics:MetricsRegistry
+    Profiler:Profiler
+
+
+
+    def __init__(self):
+        base = self.RecorderClass
+        self.Metrics = MetricsRegistry()
+        self.Metrics.addCollector(threadCpuCollector)
+        self.Profiler = Profiler(base.ProfileDir, controlFile=base.ProfileControlFile)
+
+        self.readers = {}
+        for name in dict.fromkeys(source["device"] for source in self.Sources):
+            channels = max(source["channel"] for source in self.Sources if source["device"] == name) + 1
+            device = i2sDevice(device=name, sample_rate=base.FrameRate, channels=channels)
+            self.readers[name] = DeviceReader(device, base.SingleTrackDuration, base.CaptureBufferSeconds)
+
+        self.recorders = []
+        for source in self.Sources:
+            sourceClass = type(f"{source['name']}Recorder", (base,), {
+                "SourceName": source["name"],
+                "i2sAudioDevice": source["device"],
+                "ChannelToKeep": source["channel"],
+                "AudioTracksDir": os.path.join(self.AudioTracksDir, source["name"]),
+                "ProcessedDir": os.path.join(self.ProcessedDir, source["name"]),
+                "SpillDir": os.path.join(self.AudioTracksDir, source["name"], "spill"),
+                "PoolShare": len(self.Sources),
+            })
+            channelSource = self.readers[source["device"]].addSource(source["channel"])
+            print(f"Sorgente {source['name']}: {source['device']} canale {source['channel']}")
+            self.recorders.append(sourceClass(device=channelSource, metrics=self.Metrics, profiler=self.Profiler))
+
+        if base.ProcessingWorkers > 1:
+            # Un solo pool per tutte le sorgenti (la configurazione DSP e' comune), con almeno due slot ciascuna
+            self.Pool = EnhancePool(
+                workers=base.ProcessingWorkers,
+                slotFrames=self.recorders[0].poolSlotFrames(),
+                enhancerConfig=self.recorders[0].enhancerConfig(),
+                slots=max(base.ProcessingWorkers, len(self.Sources)) * 2)
+            for recorder in self.recorders:
+                recorder.Pool = self.Pool
+
+
+
+    def startRecording(self):
+        self.start()
+
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            print("Terminazione richiesta dall'utente.")
+            self.Profiler.stop()
+
+
+
+    def start(self):
+        """Servizi condivisi, pipeline delle sorgenti e lettori dei device, senza bloccare"""
+        base = self.RecorderClass
+        self.Profiler.install()
+        if base.MetricsPort:
+            self.Metrics.serve(base.MetricsPort)
+        if base.MetricsSnapshotFile:
+            os.makedirs(self.AudioTracksDir, exist_ok=True)
+            self.Metrics.startSnapshots(os.path.join(self.AudioTracksDir, base.MetricsSnapshotFile), base.MetricsSnapshotInterval)
+
+        for recorder in self.recorders:
+            recorder.startWorkers()
+        for reader in self.readers.values():
+            reader.start()
+
+
+
+if __name__ == "__main__":
+    MultiSourceRecorder().startRecording()
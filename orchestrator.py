@@ -0,0 +1,278 @@
+import os
+import sys
+import time
+import shutil
+import signal
+import asyncio
+import threading
+import subprocess
+import traceback
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+from i2sRecorder import i2sRecorder
+from multiRecorder import MultiSourceRecorder
+from dash_processor import DashProcessor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "megacloud"))
+from copyCloud import HLSCopyCloud
+
+
+
+class RecorderDaemon:
+    """Un solo processo per cattura, elaborazione, packaging e copia nel cloud.
+
+    Prende il posto di infinity_recorder.py / recorder.py (systemd o supervisord),
+    di dash_processor.py e di megacloud/copyCloud.py (cron): la cattura e la
+    pipeline restano nei thread del recorder, che partono per primi e girano a
+    priorita' normale; il resto e' schedulato da un event loop asyncio.
+
+    Ogni gruppo chiuso arriva al loop come evento (i2sRecorder.GroupListeners):
+    quando compare il primo gruppo di un giorno nuovo, o quando la pipeline ha
+    superato la mezzanotte di DayCloseGrace secondi, il giorno precedente e'
+    chiuso e passa agli stadi in background (playlist VOD, DASH, cloud), senza
+    scandire processed_audio.
+    Il lavoro in background gira in BackgroundWorkers thread con nice
+    BackgroundNice (ereditato dai processi ffmpeg) e classe I/O idle, con i
+    limiti DISK_SLOTS/UPLOAD_SLOTS di HLSCopyCloud condivisi anche dal DASH, e
+    attende ogni volta che il ritardo della cattura superi MaxCaptureLag."""
+
+    MultiSource:bool = False  # True: sorgenti di MultiSourceRecorder.Sources, False: un solo i2sRecorder
+
+    DashEnabled:bool = False  # archivio DASH in archive/YYYYMMDD (cancella i gruppi m4a della giornata)
+    CloudEnabled:bool = True  # copia HLS nel cloud e rimozione locale della cartella verificata
+
+    BackgroundWorkers:int = 2
+    BackgroundNice:int = 10
+    BackgroundIdleIO:bool = True  # ionice -c3 sui thread in background, se disponibile
+    MaxCaptureLag:float = 60.0  # secondi di ritardo della pipeline oltre i quali il background aspetta
+    HealthCheckInterval:float = 5.0
+    DayCloseGrace:int = None  # secondi di audio elaborato dopo mezzanotte, di default due gruppi (l'ultimo gruppo del giorno chiude dopo mezzanotte)
+    CatchUpOnStart:bool = True  # una tantum all'avvio: giorni passati rimasti in processed_audio
+
+    BaseDir:str = os.path.dirname(os.path.abspath(__file__))
+
+    capture = None
+    recorders:list
+    dash:DashProcessor = None
+    cloud:HLSCopyCloud = None
+
+    loop:asyncio.AbstractEventLoop
+    events:asyncio.Queue
+    openDays:dict  # ProcessedDir -> giorni con gruppi, non ancora chiusi
+    recordersByDir:dict
+    pendingDays:set
+    dayTasks:set  # riferimenti ai task processDay: il loop ne tiene solo di deboli
+    background:ThreadPoolExecutor
+    stopping:asyncio.Event
+
+    PendingJobs = None
+    DaysDone = None
+    DaysFailed = None
+    ThrottledSeconds = None
+
+
+
+    def __init__(self):
+        # Cattura per prima: device e pipeline pronti prima di qualsiasi lavoro in background
+        if self.MultiSource:
+            self.capture = MultiSourceRecorder()
+            self.recorders = self.capture.recorders
+        else:
+            self.capture = i2sRecorder()
+            self.recorders = [self.capture]
+
+        if self.DayCloseGrace is None:
+            self.DayCloseGrace = 2 * self.recorders[0].ProcessingTrackDuration
+
+        if self.CloudEnabled:
+            self.cloud = HLSCopyCloud()
+        if self.DashEnabled:
+            self.dash = DashProcessor(self.BaseDir, single_pass=True)
+            if self.cloud is not None:
+                # Rewrap HLS e DASH leggono l'intera giornata: un solo budget disco per entrambi
+                self.dash.io_slots = self.cloud.diskSlots
+
+        # Per cartella: i gruppi ricostruiti dal recupero arrivano dalla copia del recorder, con la stessa ProcessedDir
+        self.recordersByDir = {recorder.ProcessedDir: recorder for recorder in self.recorders}
+        self.openDays = {recorder.ProcessedDir: set() for recorder in self.recorders}
+        self.pendingDays = set()
+        self.dayTasks = set()
+
+        metrics = self.recorders[0].Metrics
+        self.PendingJobs = metrics.gauge("background_jobs_pending", "Closed days waiting for background stages")
+        self.DaysDone = metrics.counter("background_days_total", "Closed days completed by the background stages")
+        self.DaysFailed = metrics.counter("background_days_failed_total", "Closed days left on disk after a background error")
+        self.ThrottledSeconds = metrics.counter("background_throttled_seconds_total", "Time background jobs waited for the capture to catch up")
+
+
+
+    def run(self):
+        # Profiler e segnali vanno registrati dal thread principale, prima del loop
+        self.capture.start()
+        try:
+            asyncio.run(self.main())
+        finally:
+            self.recorders[0].Profiler.stop()
+
+
+
+    async def main(self):
+        self.loop = asyncio.get_running_loop()
+        self.events = asyncio.Queue()
+        self.stopping = asyncio.Event()
+        self.background = ThreadPoolExecutor(max_workers=self.BackgroundWorkers, thread_name_prefix="Background",
+                                             initializer=self.lowerThreadPriority)
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            self.loop.add_signal_handler(signum, self.stopping.set)
+
+        for recorder in self.recorders:
+            recorder.GroupListeners.append(self.groupClosed)
+
+        if self.CatchUpOnStart:
+            await self.catchUp()
+        tasks = [
+            asyncio.create_task(self.eventWorker(), name="Events"),
+            asyncio.create_task(self.dayTimer(), name="DayTimer"),
+        ]
+
+        await self.stopping.wait()
+        print("[Daemon] Terminazione richiesta, i giorni in corso riprenderanno dai checkpoint al prossimo avvio")
+        for task in tasks + list(self.dayTasks):
+            task.cancel()
+        await asyncio.gather(*tasks, *self.dayTasks, return_exceptions=True)
+        self.background.shutdown(wait=False, cancel_futures=True)
+
+
+
+    def lowerThreadPriority(self):
+        # nice e classe I/O sono per-thread su Linux e passano ai processi figli (ffmpeg)
+        tid = threading.get_native_id()
+        try:
+            os.setpriority(os.PRIO_PROCESS, tid, self.BackgroundNice)
+        except (OSError, AttributeError) as e:
+            print(f"[Daemon] Priorita' del thread in background non modificata: {e}")
+        if self.BackgroundIdleIO and shutil.which("ionice"):
+            subprocess.run(["ionice", "-c3", "-p", str(tid)], capture_output=True)
+
+
+
+    def groupClosed(self, recorder, groupPath, startTime, duration):
+        # Dal thread di processing del recorder: solo il passaggio dell'evento al loop
+        self.loop.call_soon_threadsafe(self.events.put_nowait, (recorder, startTime.strftime("%Y%m%d")))
+
+
+
+    async def eventWorker(self):
+        while True:
+            source, day = await self.events.get()
+            recorder = self.recordersByDir[source.ProcessedDir]
+            self.openDays[recorder.ProcessedDir].add(day)
+            self.closeDays(recorder, day)
+
+
+
+    async def dayTimer(self):
+        """Giorni senza un gruppo successivo (silenzio scartato, cattura ferma, arretrati dell'avvio).
+
+        Conta la posizione della pipeline, non l'orologio: un giorno si chiude quando
+        il processor ha superato la mezzanotte successiva di DayCloseGrace secondi."""
+        while True:
+            for recorder in self.recorders:
+                processedUntil = recorder.Stats["processedUntil"]
+                if processedUntil:
+                    self.closeDays(recorder, datetime.fromtimestamp(processedUntil - self.DayCloseGrace).strftime("%Y%m%d"))
+            await asyncio.sleep(60)
+
+
+
+    def closeDays(self, recorder, beforeDay):
+        """Chiude i giorni aperti precedenti a beforeDay, tranne quelli che possono ancora ricevere gruppi:
+        quello del gruppo aperto e quelli ancora da ricostruire dal recupero dopo un riavvio"""
+        limit = beforeDay
+        groupStart = recorder.GroupStartTime
+        if recorder.GroupEncoder is not None and groupStart:
+            limit = min(limit, groupStart.strftime("%Y%m%d"))
+        if recorder.RecoveringSince is not None:
+            limit = min(limit, datetime.fromtimestamp(recorder.RecoveringSince).strftime("%Y%m%d"))
+
+        days = self.openDays[recorder.ProcessedDir]
+        for closed in sorted(d for d in days if d < limit):
+            days.discard(closed)
+            self.submitDay(recorder, closed)
+
+
+
+    async def catchUp(self):
+        """Giorni passati lasciati da un'esecuzione precedente: solo l'elenco delle cartelle, una volta.
+
+        Restano aperti finche' dayTimer non vede la pipeline oltre di essi (es. gruppi in recupero)."""
+        today = datetime.now().strftime("%Y%m%d")
+        for recorder in self.recorders:
+            if not os.path.isdir(recorder.ProcessedDir):
+                continue
+            for name in sorted(os.listdir(recorder.ProcessedDir)):
+                if name.isdigit() and len(name) == 8 and name < today and os.path.isdir(os.path.join(recorder.ProcessedDir, name)):
+                    self.openDays[recorder.ProcessedDir].add(name)
+
+
+
+    def submitDay(self, recorder, day):
+        key = (recorder.ProcessedDir, day)
+        if key in self.pendingDays:
+            return
+        self.pendingDays.add(key)
+        self.PendingJobs.set(len(self.pendingDays))
+        print(f"[Daemon] Giorno {day} chiuso{f' per {recorder.SourceName}' if recorder.SourceName else ''}, in coda per il background")
+        task = asyncio.create_task(self.processDay(recorder, day), name=f"Day-{day}")
+        self.dayTasks.add(task)
+        task.add_done_callback(self.dayTasks.discard)
+
+
+
+    async def processDay(self, recorder, day):
+        folder = os.path.join(recorder.ProcessedDir, day)
+        cloudName = os.path.join(recorder.SourceName, day) if recorder.SourceName else day
+        try:
+            if recorder.Packager is not None:
+                await self.loop.run_in_executor(self.background, recorder.Packager.finalizeDay, day)
+
+            if self.dash is not None:
+                # Il DASH cancella i gruppi m4a: prima del cloud solo se la playlist HLS non ne ha piu' bisogno
+                if self.cloud is None or self.cloud.isLivePackaged(folder, day):
+                    await self.whenCaptureHealthy()
+                    await self.loop.run_in_executor(self.background, self.dash.process_folder, folder)
+                else:
+                    print(f"[Daemon] DASH di {day} saltato: la playlist HLS va ancora ricostruita dai gruppi")
+
+            if self.cloud is not None:
+                await self.whenCaptureHealthy()
+                await self.loop.run_in_executor(self.background, self.cloud.processFolder, folder, cloudName)
+                if os.path.exists(folder):
+                    raise RuntimeError(f"{folder} non copiata nel cloud, riprovo al prossimo avvio")
+                if recorder.Index is not None:
+                    await self.loop.run_in_executor(self.background, recorder.Index.prune)
+            self.DaysDone.inc()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.DaysFailed.inc()
+            print(f"[Daemon] Errore sul giorno {day}: {e}")
+            traceback.print_exc()
+        finally:
+            self.pendingDays.discard((recorder.ProcessedDir, day))
+            self.PendingJobs.set(len(self.pendingDays))
+
+
+
+    async def whenCaptureHealthy(self):
+        """La cattura ha la precedenza: il background parte solo se la pipeline e' in pari"""
+        started = time.monotonic()
+        while max(recorder.Stats["lagSeconds"] for recorder in self.recorders) > self.MaxCaptureLag:
+            await asyncio.sleep(self.HealthCheckInterval)
+        self.ThrottledSeconds.inc(time.monotonic() - started)
+
+
+
+if __name__ == "__main__":
+    RecorderDaemon().run()
@@ -0,0 +1,163 @@
+import os
+import sys
+import json
+import time
+import signal
+import threading
+import tracemalloc
+import collections
+from datetime import datetime
+
+
+
+class Profiler:
+    """Profilazione a richiesta, spenta di default e quindi a costo zero.
+
+    Si accende e si spegne con SIGUSR1 (kill -USR1 <pid>) oppure creando e
+    cancellando controlFile. Da acceso campiona gli stack dei thread con
+    sys._current_frames, segue le allocazioni con tracemalloc e raccoglie i
+    tempi per blocco passati a trace(). Allo spegnimento scrive in outputDir:
+    stacks (formato collapsed, per flamegraph), top-N delle differenze di memoria
+    e tracce per blocco in JSON lines."""
+
+    outputDir:str
+    controlFile:str
+    sampleInterval:float
+    topN:int
+
+    active:bool = False
+    sampler:threading.Thread = None  # dallo start() fino alla fine del dump dello stop()
+    lock:threading.Lock
+    stacks:collections.Counter
+    traces:list
+    startSnapshot:tracemalloc.Snapshot = None
+    startedAt:datetime = None
+
+
+
+    def __init__(self, outputDir:str, controlFile:str=None, sampleInterval:float=0.01, topN:int=25):
+        self.outputDir = outputDir
+        self.controlFile = controlFile
+        self.sampleInterval = sampleInterval
+        self.topN = topN
+        self.lock = threading.Lock()
+        self.stacks = collections.Counter()
+        self.traces = []
+
+
+
+    def install(self, signalNumber:int=signal.SIGUSR1, pollSeconds:float=2.0):
+        """Registra il segnale (va chiamato dal thread principale) e il controllo del file"""
+        signal.signal(signalNumber, lambda signum, frame: self.toggle())
+        if self.controlFile:
+            threading.Thread(target=self.__watchControlFile, args=(pollSeconds,), name="ProfilerControl", daemon=True).start()
+        print(f"[Profiler] Pronto: kill -{signal.Signals(signalNumber).name[3:]} {os.getpid()}"
+              + (f" oppure touch {self.controlFile}" if self.controlFile else ""))
+
+
+
+    def __watchControlFile(self, pollSeconds:float):
+        # Conta solo il cambiamento del file, cosi' non interferisce con una profilazione avviata dal segnale
+        present = os.path.exists(self.controlFile)
+        if present:
+            self.start()
+        while True:
+            time.sleep(pollSeconds)
+            requested = os.path.exists(self.controlFile)
+            if requested != present:
+                present = requested
+                self.start() if requested else self.stop()
+
+
+
+    def toggle(self):
+        # Dal gestore di segnale: il lavoro vero va fuori, in un thread
+        threading.Thread(target=self.stop if self.active else self.start, daemon=True).start()
+
+
+
+    def start(self):
+        with self.lock:
+            if self.active:
+                return
+            if self.sampler is not None:
+                # Uno stop() sta ancora aspettando il campionatore o scrivendo i risultati
+                print("[Profiler] Stop precedente non ancora concluso, avvio ignorato")
+                return
+            self.stacks.clear()
+            self.traces = []
+            self.startedAt = datetime.now()
+            tracemalloc.start()
+            self.startSnapshot = tracemalloc.take_snapshot()
+            self.active = True
+            self.sampler = threading.Thread(target=self.__sampleStacks, name="ProfilerSampler", daemon=True)
+            self.sampler.start()
+        print("[Profiler] Avviato")
+
+
+
+    def stop(self):
+        with self.lock:
+            if not self.active:
+                return
+            self.active = False
+            snapshot = tracemalloc.take_snapshot()
+            tracemalloc.stop()
+        # Il campionatore finisce il giro in corso: dump non deve leggere stacks mentre cambia
+        self.sampler.join()
+        try:
+            path = self.dump(snapshot)
+        finally:
+            with self.lock:
+                self.sampler = None
+        print(f"[Profiler] Fermato, risultati in {path}")
+
+
+
+    def trace(self, event:str, **fields):
+        """Tempi di un blocco (stadio, durata...): ignorato, con un solo controllo, se il profiler e' spento"""
+        if self.active:
+            self.traces.append({"time": time.time(), "thread": threading.current_thread().name, "event": event, **fields})
+
+
+
+    def __sampleStacks(self):
+        own = threading.get_ident()
+        names = {}
+        while self.active:
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                if ident not in names:
+                    names = {t.ident: t.name for t in threading.enumerate()}
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                self.stacks[";".join(reversed(stack))] += 1
+            time.sleep(self.sampleInterval)
+
+
+
+    def dump(self, snapshot:tracemalloc.Snapshot):
+        folder = os.path.join(self.outputDir, f"profile_{self.startedAt.strftime('%Y%m%d_%H%M%S')}")
+        os.makedirs(folder, exist_ok=True)
+
+        with open(os.path.join(folder, "stacks.txt"), "w", encoding="utf-8") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+        with open(os.path.join(folder, "memory.txt"), "w", encoding="utf-8") as f:
+            ignore = (tracemalloc.Filter(False, tracemalloc.__file__),)
+            snapshot = snapshot.filter_traces(ignore)
+            allocated = sum(stat.size for stat in snapshot.statistics("filename"))
+            f.write(f"Allocato ora: {allocated / 1e6:.1f} MB\n\nTop {self.topN} differenze dall'avvio:\n")
+            for stat in snapshot.compare_to(self.startSnapshot.filter_traces(ignore), "lineno")[:self.topN]:
+                f.write(f"{stat}\n")
+
+        with open(os.path.join(folder, "traces.jsonl"), "w", encoding="utf-8") as f:
+            for entry in self.traces:
+                f.write(json.dumps(entry) + "\n")
+        return folder
@@ -1,16 +1,19 @@
-import sounddevice as sd
 from scipy.io.wavfile import write
 import wavio as wv
 import uuid
-import tracemalloc
+import resource
 from datetime import datetime
 import time
-from threading import Thread
+import queue
+import bisect
+from datetime import timedelta
+from threading import Thread, Condition
 from loguru import logger
 import soundfile as sf
 import os
 import re
-from pydub import AudioSegment
+from archiveIndex import ArchiveIndex
+from profiler import Profiler
 #import pyaudio
   
 config = {
@@ -20,10 +23,22 @@ config = {
     "dest_folder":"./audio/",
     "prefix_name":"record_",
     "extension":"ogg",
-    "counter":0
+    "max_pending_chunks":6,
+    "dtype":"int16",
+    "join_size":10,
+    "index_name":"archive.sqlite",
+    "profile_folder":"./profiles/",
+    "profile_control":"./PROFILE",
+    "counter":0,
+    "dropped":0
 }
 
-chunks = []
+chunks = queue.Queue(maxsize=config["max_pending_chunks"])
+pendingChunks = {}  # day folder -> sorted chunk file names waiting to be joined
+pendingCondition = Condition()
+archive = None  # ArchiveIndex in dest_folder, opened by main()
+# Off until SIGUSR1 or profile_control appears: no tracemalloc cost in normal operation
+profiler = Profiler(config["profile_folder"], controlFile=config["profile_control"])
 interrupt = False
 regExDT = "^([0-9]{4})([0-9]{2})([0-9]{2})([0-9]{2})([0-9]{2})([0-9]{2})$"
 
@@ -38,12 +53,22 @@ def GetHumanReadable(size,precision=2):
     return "%.*f%s"%(precision,size,suffixes[suffixIndex])
 
 def recordChunk():
+    # Solo qui serve PortAudio: il modulo si importa anche senza scheda audio (benchmark.py)
+    import sounddevice as sd
     now = datetime.now()
     init = now.strftime("%Y%m%d%H%M%S")
     recording = sd.rec(int(config["chunk_duration"] * config["freq"]), 
-                samplerate=config["freq"], channels=1)
+                samplerate=config["freq"], channels=1, dtype=config["dtype"])
     sd.wait()
-    chunks.append({"init":init, "data":recording})
+    chunk = {"init":init, "data":recording}
+    try:
+        chunks.put_nowait(chunk)
+    except queue.Full:
+        # Writer behind by the whole memory budget: losing this chunk beats delaying the next sd.rec.
+        # A single FIFO writer keeps the chunks on disk in capture order for the joiner.
+        config["dropped"] += 1
+        logger.error(f'Writer behind, chunk {init} dropped ({config["dropped"]} dropped so far)')
+        profiler.trace("drop_chunk", chunk=init, dropped=config["dropped"])
     config["counter"] += 1
     logger.info(f'Acquired {config["counter"]} chunks...')
     del recording
@@ -66,29 +91,45 @@ def saveRecords():
 
 
 
+def _writeChunk(chunk):
+    filename = "chunk." + chunk["init"] + ".wav"
+    subfolder = chunk["init"][0:8]
+    if not os.path.isdir(config["chunk_folder"] + subfolder):
+        os.makedirs(config["chunk_folder"] + subfolder, exist_ok=True)
+
+    logger.info(f'Chunk Saving {filename}...')
+    sf.write(config["chunk_folder"] + subfolder + "/" + filename, chunk["data"], config["freq"])
+    _indexChunk(subfolder, filename)
+
+
+
+def _indexChunk(subfolder, filename):
+    with pendingCondition:
+        bisect.insort(pendingChunks.setdefault(subfolder, []), filename)
+        pendingCondition.notify()
+
+
+
 def _saveChunk():
     while True:
-        if len(chunks) > 0:
-            saved = False
-            while saved is False:
-                chunk = chunks[len(chunks)-1]
-                filename = "chunk." + chunk["init"] + ".wav"
-                subfolder = chunk["init"][0:8]
-                if not os.path.isdir(config["chunk_folder"] + subfolder):
-                    os.makeidrs(config["chunk_folder"] + subfolder, exist_ok=True)
-
-                logger.info(f'Chunk Saving {filename}...')
-                
-                try:
-                    sf.write(config["chunk_folder"] + subfolder + "/" + filename, chunk["data"], config["freq"])
-                    saved = True
-                    chunks.pop()
-                except Exception as e:
-                    logger.error('Saving error - retrying... ' + str(e))
-                    time.sleep(2)
-        time.sleep(30)
-        memUsed = tracemalloc.get_traced_memory()
-        logger.info("Memory: " + GetHumanReadable(memUsed[1]))
+        # FIFO: blocks until the recorder hands over the next chunk, oldest first
+        chunk = chunks.get()
+        saved = False
+        while saved is False:
+            try:
+                start = time.monotonic()
+                _writeChunk(chunk)
+                saved = True
+                elapsed = time.monotonic() - start
+                logger.info(f'Chunk {chunk["init"]} saved in {elapsed * 1000:.0f} ms')
+                profiler.trace("save_chunk", chunk=chunk["init"], seconds=elapsed, pending=chunks.qsize())
+            except Exception as e:
+                logger.error('Saving error - retrying... ' + str(e))
+                time.sleep(2)
+        chunks.task_done()
+        # Peak RSS from the kernel (KiB on Linux): free, unlike tracing every allocation
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+        logger.info("Memory peak: " + GetHumanReadable(peak) + " - pending chunks: " + str(chunks.qsize()))
 
 
 
@@ -99,29 +140,61 @@ def _sortdir(directory):
 
 
 
+def _seedIndex():
+    # Single scan at startup for chunks left over by a previous run, then the writer feeds the index
+    if not os.path.isdir(config["chunk_folder"]):
+        return
+    for cdir in _sortdir(config["chunk_folder"]):
+        chunkDirPath = config["chunk_folder"] + cdir
+        if os.path.isdir(chunkDirPath):
+            for f in _sortdir(chunkDirPath):
+                _indexChunk(cdir, f)
+            with pendingCondition:
+                pendingChunks.setdefault(cdir, [])
+
+
+
+def _nextJoin():
+    nowFolder = datetime.now().strftime("%Y%m%d")
+    for cdir in sorted(pendingChunks):
+        files = pendingChunks[cdir]
+        if len(files) >= config["join_size"]:
+            block = files[:config["join_size"]]
+            del files[:config["join_size"]]
+            return cdir, block
+        if cdir != nowFolder:
+            # Day rollover: flush the partial group and forget the day
+            del pendingChunks[cdir]
+            return cdir, files
+    return None
+
+
+
+def _secondsToMidnight():
+    now = datetime.now()
+    midnight = (now + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+    return (midnight - now).total_seconds()
+
+
+
 def _saveRecords():
+    _seedIndex()
     while True:
-        now = datetime.now()
-        nowFolder = now.strftime("%Y%m%d")
-        chunksDir = _sortdir(config["chunk_folder"])
-        chunksDir = sorted(chunksDir)
-
-        for cdir in chunksDir:
-            chunkDirPath = config["chunk_folder"] + cdir
-            chunkFiles = _sortdir(chunkDirPath)
-            if len(chunkFiles) == 0 and cdir != nowFolder:
-                os.removedirs(chunkDirPath)
-                time.sleep(10)
-                break
-            
-            if len(chunkFiles) > 10:
-                blockFiles = chunkFiles[slice(10)]
-                _joinChunks(chunkDirPath, blockFiles)
-            else:
-                if cdir != nowFolder :
-                    _joinChunks(chunkDirPath, chunkFiles)
-
-        time.sleep(30)
+        with pendingCondition:
+            job = _nextJoin()
+            while job is None:
+                pendingCondition.wait(timeout=_secondsToMidnight() + 1)
+                job = _nextJoin()
+
+        cdir, files = job
+        chunkDirPath = config["chunk_folder"] + cdir
+        if len(files) > 0:
+            _joinChunks(chunkDirPath, files)
+        if cdir != datetime.now().strftime("%Y%m%d"):
+            try:
+                os.rmdir(chunkDirPath)
+            except OSError:
+                pass
 
 
 def _joinChunks(chunkDirPath, files):
@@ -139,32 +212,41 @@ def _joinChunks(chunkDirPath, files):
             str(infoDateTime[3]) + "-" + \
             str(infoDateTime[4]) + "-" + \
             str(infoDateTime[5]) + ".ogg"
-    audioFile = None
-    _aud = None
-    for f in files:
-        if audioFile is None:
-            audioFile = AudioSegment.from_file(chunkDirPath + f, format="wav")
-        else:
-            _aud = AudioSegment.from_file(chunkDirPath + f, format="wav")
-            audioFile = audioFile + _aud
-
     logger.info("Saving file " + audioFileName + " in " + audioFolder + "...")
     if not os.path.isdir(config["dest_folder"] + audioFolder):
         os.makedirs(config["dest_folder"] + audioFolder, exist_ok=True)
-    file_handle = audioFile.export(config["dest_folder"] + audioFolder + "/" + audioFileName, format="ogg")
+
+    # Chunks are streamed into the encoder one by one: linear time, one chunk in memory
+    start = time.monotonic()
+    frames = 0
+    seekPoints = []  # (chunk start, offset in the ogg, frames): one index row per chunk
+    with sf.SoundFile(config["dest_folder"] + audioFolder + "/" + audioFileName, "w",
+                      samplerate=config["freq"], channels=1, format="OGG", subtype="VORBIS") as audioFile:
+        for f in files:
+            data, _ = sf.read(chunkDirPath + f, dtype="float32")
+            audioFile.write(data)
+            seekPoints.append((datetime.strptime(f.split(".")[1], "%Y%m%d%H%M%S"), frames, len(data)))
+            frames += len(data)
+    profiler.trace("join_chunks", file=audioFileName, chunks=len(files), seconds=time.monotonic() - start)
+
+    if archive is not None:
+        for startTime, offset, length in seekPoints:
+            archive.addSegment(config["dest_folder"] + audioFolder + "/" + audioFileName,
+                               startTime, length / config["freq"], config["freq"], "ogg",
+                               byteOffset=None, startSample=offset)
 
     for f in files:
         os.remove(chunkDirPath + f)
-    del audioFile
-    del _aud
 
-    
 
 
 
 
 def main():
-    tracemalloc.start()
+    global archive
+    profiler.install()
+    os.makedirs(config["dest_folder"], exist_ok=True)
+    archive = ArchiveIndex(config["dest_folder"] + config["index_name"])
     try:
         logger.info("Starting recording...")
         saveChunk()
@@ -172,12 +254,10 @@ def main():
         while True:
             recordChunk()
     except KeyboardInterrupt:
-        while len(chunks) > 0:
-            time.sleep(3)
+        pass
     finally:
-        while len(chunks) > 0:
-            time.sleep(3)
-    tracemalloc.stop()
+        chunks.join()
+        profiler.stop()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,98 @@
+import threading
+import numpy as np
+
+
+
+class RingBuffer:
+    """Ring preallocato di frame audio, un solo produttore e un solo consumatore.
+
+    La callback di PortAudio e' l'unica a scrivere e il thread del recorder
+    l'unico a leggere: ognuno fa avanzare il proprio indice monotono, quindi la
+    copia dei campioni non prende lock. I frame che non ci stanno vengono
+    scartati e contati."""
+
+    capacity:int
+    channels:int
+    buffer:np.ndarray
+
+    writeIndex:int
+    readIndex:int
+    droppedFrames:int
+
+    dataReady:threading.Event
+    closed:bool
+
+
+
+    def __init__(self, frames:int, channels:int, dtype:str='float32'):
+        self.capacity = frames
+        self.channels = channels
+        self.buffer = np.zeros((frames, channels), dtype=dtype)
+
+        self.writeIndex = 0
+        self.readIndex = 0
+        self.droppedFrames = 0
+
+        self.dataReady = threading.Event()
+        self.closed = False
+
+
+
+    def available(self):
+        return self.writeIndex - self.readIndex
+
+
+
+    def free(self):
+        return self.capacity - self.available()
+
+
+
+    def write(self, frames:np.ndarray):
+        """Lato produttore, chiamabile dalla callback audio (nessuna allocazione)"""
+        count = len(frames)
+        free = self.free()
+        if count > free:
+            self.droppedFrames += count - free
+            count = free
+        if count == 0:
+            return 0
+
+        start = self.writeIndex % self.capacity
+        first = min(count, self.capacity - start)
+        self.buffer[start:start + first] = frames[:first]
+        if count > first:
+            self.buffer[:count - first] = frames[first:count]
+
+        self.writeIndex += count
+        self.dataReady.set()
+        return count
+
+
+
+    def read(self, frames:int, timeout:float=None):
+        """Lato consumatore, attende finche' non ci sono `frames` frame contigui"""
+        while True:
+            self.dataReady.clear()
+            if self.available() >= frames:
+                break
+            if self.closed:
+                raise RuntimeError("Ring buffer closed while waiting for frames.")
+            if not self.dataReady.wait(timeout):
+                raise TimeoutError(f"No audio frames received in {timeout}s.")
+
+        out = np.empty((frames, self.channels), dtype=self.buffer.dtype)
+        start = self.readIndex % self.capacity
+        first = min(frames, self.capacity - start)
+        out[:first] = self.buffer[start:start + first]
+        if frames > first:
+            out[first:] = self.buffer[:frames - first]
+
+        self.readIndex += frames
+        return out
+
+
+
+    def close(self):
+        self.closed = True
+        self.dataReady.set()
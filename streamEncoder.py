@@ -0,0 +1,112 @@
+import os
+import subprocess
+import tempfile
+import numpy as np
+
+from encoderPresets import getPreset, presetArgs
+
+
+
+class StreamEncoder:
+    """Long-lived ffmpeg process fed with raw float32 PCM through a pipe.
+
+    Blocks are appended as soon as they are ready, the output is written to a
+    `.part` file and renamed in place by close(), so an interrupted group never
+    looks like a finished one."""
+
+    outputPath:str
+    tmpPath:str
+    sampleRate:int
+    channels:int
+    preset:dict
+
+    process:subprocess.Popen = None
+    framesWritten:int = 0
+    cpuSeconds:float = 0.0
+
+
+
+    def __init__(self, outputPath:str, sampleRate:int, channels:int=1, preset:str="aac-128k"):
+        self.outputPath = outputPath
+        self.tmpPath = outputPath + ".part"
+        self.sampleRate = sampleRate
+        self.channels = channels
+        self.preset = getPreset(preset)
+
+
+
+    def command(self):
+        return [
+            "ffmpeg", "-y", "-nostdin", "-hide_banner", "-loglevel", "error",
+            "-f", "f32le",
+            "-ar", str(self.sampleRate),
+            "-ac", str(self.channels),
+            "-i", "pipe:0",
+            *presetArgs(self.preset),
+            self.tmpPath
+        ]
+
+
+
+    def open(self):
+        self.errorLog = tempfile.TemporaryFile()
+        self.framesWritten = 0
+        self.process = subprocess.Popen(
+            self.command(),
+            stdin=subprocess.PIPE,
+            stdout=subprocess.DEVNULL,
+            stderr=self.errorLog
+        )
+        return self
+
+
+
+    def write(self, block:np.ndarray):
+        block = np.ascontiguousarray(block, dtype=np.float32)
+        try:
+            self.process.stdin.write(block.data)
+        except BrokenPipeError:
+            raise RuntimeError(f"ffmpeg terminated while encoding {self.outputPath}: {self.__errors()}")
+        self.framesWritten += len(block)
+
+
+
+    def close(self):
+        """Flush the encoder and move the finished file in place"""
+        self.process.stdin.close()
+        # wait4 restituisce anche le risorse usate da ffmpeg: CPU effettiva della codifica
+        _, status, usage = os.wait4(self.process.pid, 0)
+        returncode = os.waitstatus_to_exitcode(status)
+        self.process.returncode = returncode
+        self.cpuSeconds = usage.ru_utime + usage.ru_stime
+        self.process = None
+        if returncode != 0:
+            errors = self.__errors()
+            self.__removeTmp()
+            raise RuntimeError(f"ffmpeg exit code {returncode} encoding {self.outputPath}: {errors}")
+        self.errorLog.close()
+        os.replace(self.tmpPath, self.outputPath)
+        return self.outputPath
+
+
+
+    def abort(self):
+        if self.process is not None:
+            self.process.kill()
+            self.process.wait()
+            self.process = None
+        self.__removeTmp()
+
+
+
+    def __errors(self):
+        self.errorLog.seek(0)
+        errors = self.errorLog.read().decode(errors="replace").strip()
+        self.errorLog.close()
+        return errors
+
+
+
+    def __removeTmp(self):
+        if os.path.exists(self.tmpPath):
+            os.remove(self.tmpPath)
@@ -0,0 +1,99 @@
+import math
+import numpy as np
+from scipy.signal import firwin, upfirdn
+
+
+
+class StreamResampler:
+    """Ricampionamento polifase razionale (up/down) su un flusso di blocchi.
+
+    Conserva la coda di ingresso che serve al filtro e la fase dell'uscita, quindi
+    blocchi consecutivi danno esattamente lo stesso segnale del flusso intero,
+    senza transitori ai bordi. Il filtro e' quello di scipy.signal.resample_poly."""
+
+    inputRate:int
+    outputRate:int
+    up:int
+    down:int
+    taps:np.ndarray
+
+    history:np.ndarray
+    historyStart:int
+    inputCount:int
+    nextOutput:int
+
+
+
+    def __init__(self, inputRate:int, outputRate:int):
+        self.inputRate = inputRate
+        self.outputRate = outputRate
+        ratio = math.gcd(inputRate, outputRate)
+        self.up = outputRate // ratio
+        self.down = inputRate // ratio
+
+        if self.up == self.down:
+            # Stessa frequenza: process() restituisce i blocchi cosi' come sono
+            self.taps = np.ones(1, dtype=np.float32)
+            self.delay = 0
+            self.reset()
+            return
+
+        maxRate = max(self.up, self.down)
+        halfLength = 10 * maxRate
+        taps = firwin(2 * halfLength + 1, 1.0 / maxRate, window=('kaiser', 5.0)) * self.up
+        # Zeri in testa come resample_poly: il ritardo di gruppo diventa un numero intero di campioni di uscita
+        prePad = self.down - halfLength % self.down
+        self.taps = np.concatenate((np.zeros(prePad), taps)).astype(np.float32)
+
+        # Ritardo di gruppo del filtro, in campioni di uscita: l'uscita parte gia' allineata
+        self.delay = (halfLength + prePad) // self.down
+        self.reset()
+
+
+
+    def reset(self):
+        self.history = np.zeros(0, dtype=np.float32)
+        self.historyStart = 0
+        self.inputCount = 0
+        self.nextOutput = self.delay
+
+
+
+    def timeOffset(self):
+        """Secondi tra il prossimo campione di ingresso e il prossimo di uscita (ritardo del blocco corrente)"""
+        return self.inputCount / self.inputRate - (self.nextOutput - self.delay) / self.outputRate
+
+
+
+    def process(self, chunk:np.ndarray):
+        if self.up == self.down:
+            return chunk
+
+        self.history = np.concatenate((self.history, np.asarray(chunk, dtype=np.float32)))
+        self.inputCount += len(chunk)
+
+        # Ultima uscita calcolabile con i campioni gia' arrivati
+        lastOutput = ((self.inputCount - 1) * self.up) // self.down
+        if lastOutput < self.nextOutput:
+            return np.zeros(0, dtype=np.float32)
+
+        # Il buffer deve iniziare su un campione allineato alla fase del decimatore (multiplo di down)
+        # e abbastanza indietro da coprire tutto il filtro per la prima uscita richiesta
+        firstNeeded = (self.nextOutput * self.down - (len(self.taps) - 1)) // self.up
+        start = (firstNeeded // self.down) * self.down
+        if start < self.historyStart:
+            padding = np.zeros(self.historyStart - start, dtype=np.float32)
+            buffer = np.concatenate((padding, self.history))
+        else:
+            buffer = self.history[start - self.historyStart:]
+
+        filtered = upfirdn(self.taps, buffer, self.up, self.down)
+        offset = start * self.up // self.down
+        out = filtered[self.nextOutput - offset:lastOutput - offset + 1].astype(np.float32)
+        self.nextOutput = lastOutput + 1
+
+        # Tiene solo la coda necessaria al prossimo blocco
+        keepFrom = max(self.historyStart, ((self.nextOutput * self.down - (len(self.taps) - 1)) // self.up // self.down) * self.down)
+        self.history = self.history[keepFrom - self.historyStart:]
+        self.historyStart = keepFrom
+        return out
@@ -0,0 +1,8 @@
+import os
+import sys
+
+# I moduli stanno nella radice del repository, senza pacchetto
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, root)
+# megacloud gira dalla propria cartella (from cloudSync import CloudSync)
+sys.path.insert(0, os.path.join(root, "megacloud"))
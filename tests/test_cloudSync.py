@@ -0,0 +1,93 @@
+import os
+
+import pytest
+
+from cloudSync import CloudSync
+
+
+
+@pytest.fixture
+def folders(tmp_path):
+    local = tmp_path / "local"
+    (local / "segments").mkdir(parents=True)
+    (local / "20240101.m3u8").write_bytes(b"#EXTM3U\n")
+    (local / "segments" / "chunk-000.ts").write_bytes(os.urandom(300000))
+    (local / "segments" / "chunk-001.ts").write_bytes(os.urandom(200000))
+    return local, tmp_path / "remote", str(tmp_path / "manifest.json")
+
+
+
+def newSync(folders, **kwargs):
+    local, remote, manifest = folders
+    return CloudSync(str(local), str(remote), manifest, workers=2, chunkSize=64 * 1024, **kwargs)
+
+
+
+def test_upload_copies_every_file_and_verifies(folders):
+    local, remote, _ = folders
+    report = newSync(folders).sync()
+
+    assert report["uploaded"] == 3 and report["skipped"] == 0 and not report["failed"]
+    assert report["verified"]
+    for rel in ("20240101.m3u8", "segments/chunk-000.ts", "segments/chunk-001.ts"):
+        assert (remote / rel).read_bytes() == (local / rel).read_bytes()
+    assert not list(remote.rglob("*.part"))
+
+
+
+def test_manifest_skips_files_already_uploaded(folders):
+    newSync(folders).sync()
+
+    # Anche da un'istanza nuova: il manifest e' su disco
+    report = newSync(folders).sync()
+    assert report["uploaded"] == 0 and report["skipped"] == 3
+    assert report["verified"]
+
+
+
+def test_changed_files_are_uploaded_again(folders):
+    local, remote, _ = folders
+    newSync(folders).sync()
+
+    playlist = local / "20240101.m3u8"
+    playlist.write_bytes(b"#EXTM3U\n#EXT-X-ENDLIST\n")
+    # Stessa dimensione, contenuto diverso: decide l'hash
+    segment = local / "segments" / "chunk-001.ts"
+    segment.write_bytes(os.urandom(200000))
+    stat = segment.stat()
+    os.utime(segment, (stat.st_atime, stat.st_mtime + 10))
+    # Solo mtime cambiato: il contenuto e' lo stesso, niente upload
+    untouched = local / "segments" / "chunk-000.ts"
+    os.utime(untouched, (stat.st_atime, stat.st_mtime + 20))
+
+    report = newSync(folders).sync()
+    assert report["uploaded"] == 2 and report["skipped"] == 1
+    assert report["verified"]
+    assert (remote / "20240101.m3u8").read_bytes() == playlist.read_bytes()
+    assert (remote / "segments" / "chunk-001.ts").read_bytes() == segment.read_bytes()
+
+
+
+def test_corrupted_remote_fails_verification_and_is_uploaded_again(folders):
+    local, remote, _ = folders
+    newSync(folders).sync()
+
+    corrupted = remote / "segments" / "chunk-000.ts"
+    corrupted.write_bytes(b"bad")
+    report = newSync(folders).sync()
+    assert not report["verified"]
+
+    # Uscito dal manifest: il giro successivo lo ricarica
+    report = newSync(folders).sync()
+    assert report["uploaded"] == 1
+    assert report["verified"]
+    assert corrupted.read_bytes() == (local / "segments" / "chunk-000.ts").read_bytes()
+
+
+
+def test_size_check_catches_corruption_without_hash(folders):
+    local, remote, _ = folders
+    newSync(folders, verifyHash=False).sync()
+
+    (remote / "segments" / "chunk-001.ts").write_bytes(b"bad")
+    assert not newSync(folders, verifyHash=False).isComplete()
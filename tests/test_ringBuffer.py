@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+
+from ringBuffer import RingBuffer
+
+
+
+def frames(start, count, channels=2):
+    return np.arange(start, start + count, dtype=np.float32).repeat(channels).reshape(count, channels)
+
+
+
+def test_wrap_around_keeps_order():
+    ring = RingBuffer(8, 2)
+    ring.write(frames(0, 6))
+    np.testing.assert_array_equal(ring.read(5), frames(0, 5))
+
+    # Scrittura e lettura a cavallo della fine del buffer
+    assert ring.write(frames(6, 6)) == 6
+    np.testing.assert_array_equal(ring.read(7), frames(5, 7))
+    assert ring.available() == 0
+    assert ring.droppedFrames == 0
+
+
+
+def test_overflow_drops_newest_frames_and_counts_them():
+    ring = RingBuffer(8, 2)
+    ring.write(frames(0, 5))
+    assert ring.write(frames(5, 6)) == 3
+    assert ring.droppedFrames == 3
+    assert ring.free() == 0
+
+    # Restano i frame piu' vecchi, senza buchi; dopo la lettura si riparte a scrivere
+    np.testing.assert_array_equal(ring.read(8), frames(0, 8))
+    assert ring.write(frames(20, 4)) == 4
+    np.testing.assert_array_equal(ring.read(4), frames(20, 4))
+
+
+
+def test_read_timeout_and_close():
+    ring = RingBuffer(8, 1)
+    ring.write(np.zeros((2, 1), dtype=np.float32))
+    with pytest.raises(TimeoutError):
+        ring.read(4, timeout=0.01)
+    ring.close()
+    with pytest.raises(RuntimeError):
+        ring.read(4, timeout=0.01)
@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+from scipy.signal import resample_poly
+
+from streamResampler import StreamResampler
+
+
+
+def streamed(resampler, signal, blockSizes):
+    out = []
+    position = 0
+    for size in blockSizes:
+        out.append(resampler.process(signal[position:position + size]))
+        position += size
+    out.append(resampler.process(signal[position:]))
+    return np.concatenate(out)
+
+
+
+@pytest.mark.parametrize("inputRate, outputRate", [(48000, 16000), (48000, 24000), (44100, 48000), (48000, 44100), (16000, 48000)])
+def test_blocks_match_resample_poly(inputRate, outputRate):
+    rng = np.random.default_rng(0)
+    signal = (rng.standard_normal(inputRate) * 0.3).astype(np.float32)
+    resampler = StreamResampler(inputRate, outputRate)
+
+    # Blocchi di dimensione casuale, anche di un solo campione: i bordi cadono su fasi diverse del filtro
+    blockSizes = list(rng.integers(1, 4000, size=30)) + [1, 1, 2]
+    out = streamed(resampler, signal, blockSizes)
+    reference = resample_poly(signal.astype(np.float64), resampler.up, resampler.down)
+
+    # Manca solo la coda che attende campioni futuri (il ritardo del filtro)
+    assert len(reference) - len(out) <= resampler.delay + resampler.up // resampler.down + 1
+    np.testing.assert_allclose(out, reference[:len(out)], atol=1e-5)
+
+
+
+def test_block_split_does_not_change_output():
+    rng = np.random.default_rng(1)
+    signal = rng.standard_normal(30000).astype(np.float32)
+    whole = StreamResampler(48000, 16000).process(signal)
+    split = streamed(StreamResampler(48000, 16000), signal, [7, 4093, 1, 12000])
+    np.testing.assert_array_equal(whole, split)
+
+
+
+def test_same_rate_is_passthrough():
+    signal = np.arange(10, dtype=np.float32)
+    assert StreamResampler(16000, 16000).process(signal) is signal
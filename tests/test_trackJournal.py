@@ -0,0 +1,87 @@
+import os
+import numpy as np
+
+from trackJournal import TrackJournal
+
+
+
+def track(value, frames=100):
+    return np.full(frames, value, dtype=np.float32)
+
+
+
+def dataFiles(folder):
+    return sorted(name for name in os.listdir(folder) if name.endswith(".pcm"))
+
+
+
+def test_append_commit_reload(tmp_path):
+    journal = TrackJournal(str(tmp_path), 16000)
+    for i in range(4):
+        assert journal.append(f"track{i}", track(i / 10), startTime=100.0 + i, sampleIndex=i * 100) == i
+    journal.commit(1)
+
+    # Dopo un riavvio restano le tracce non salvate, con i loro tempi e i campioni intatti
+    reloaded = TrackJournal(str(tmp_path), 16000)
+    entries = reloaded.entries()
+    assert [e["seq"] for e in entries] == [2, 3]
+    assert [e["startTime"] for e in entries] == [102.0, 103.0]
+    np.testing.assert_allclose(reloaded.read(entries[1]), track(0.3), atol=1 / 32767)
+    assert reloaded.nextSeq == 4
+
+
+
+def test_commit_range_keeps_recovery_tracks(tmp_path):
+    journal = TrackJournal(str(tmp_path), 16000)
+    for i in range(3):
+        journal.append(f"old{i}", track(0.1))
+    floor = journal.nextSeq
+    for i in range(3):
+        journal.append(f"live{i}", track(0.2))
+
+    # La pipeline live libera solo le proprie tracce, il recupero solo quelle sotto floor
+    journal.commit(floor + 1, firstSeq=floor)
+    assert [e["name"] for e in journal.entries()] == ["old0", "old1", "old2", "live2"]
+    journal.commit(floor - 1)
+    assert [e["name"] for e in journal.entries()] == ["live2"]
+
+
+
+def test_commit_frees_data_files(tmp_path):
+    journal = TrackJournal(str(tmp_path), 16000)
+    journal.append("a", track(0.1))
+    journal.commit(0)
+    journal.append("b", track(0.2))
+    assert len(dataFiles(tmp_path)) == 1
+    journal.commit(1)
+    assert dataFiles(tmp_path) == []
+    assert journal.entries() == []
+
+
+
+def test_file_mode_entries(tmp_path):
+    journal = TrackJournal(str(tmp_path), 16000)
+    journal.appendFile("rec.wav", startTime=5.0, sampleIndex=80000)
+    entry = journal.entries()[0]
+    assert entry["offset"] is None
+    assert journal.read(entry) is None
+    assert dataFiles(tmp_path) == []
+
+
+
+def test_reload_repairs_truncated_index_and_orphans(tmp_path):
+    journal = TrackJournal(str(tmp_path), 16000)
+    journal.append("a", track(0.1))
+    journal.append("b", track(0.2))
+
+    # Crash a meta' di una riga dell'indice e file di dati non piu' referenziato
+    with open(journal.indexPath, "a", encoding="utf-8") as f:
+        f.write('{"seq": 2, "na')
+    open(os.path.join(tmp_path, "journal-99.pcm"), "wb").close()
+
+    reloaded = TrackJournal(str(tmp_path), 16000)
+    assert "journal-99.pcm" not in dataFiles(tmp_path)
+    reloaded.append("c", track(0.3))
+    entries = reloaded.entries()
+    assert [e["name"] for e in entries] == ["a", "b", "c"]
+    np.testing.assert_allclose(reloaded.read(entries[2]), track(0.3), atol=1 / 32767)
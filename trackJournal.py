@@ -0,0 +1,183 @@
+import os
+import json
+import threading
+import numpy as np
+
+
+
+class TrackJournal:
+    """Journal compatto per il recupero dopo un crash delle tracce che stanno solo in memoria.
+
+    Ogni traccia viene accodata come PCM a 16 bit in un file di dati e descritta
+    da una riga JSON in un file indice. Quando un gruppo e' stato salvato le sue
+    tracce vengono confermate (commit) e tolte dal journal, quindi i file tengono
+    solo l'audio non ancora scritto nell'uscita elaborata. In modalita' file le
+    tracce sono gia' WAV su disco e il journal ne tiene solo le voci dell'indice.
+
+    Il PCM non viene mai riscritto: un commit sostituisce l'indice in modo
+    atomico e poi cancella i file di dati a cui nessuna voce fa piu' riferimento,
+    quindi dopo un crash in qualsiasi punto l'indice punta solo a dati ancora
+    presenti. Dopo ogni commit le aggiunte passano a un nuovo file di dati, che
+    viene liberato insieme alle sue tracce."""
+
+    DataFileName:str = "journal.pcm"  # unico file di dati dei journal scritti prima dei file per commit
+    DataFilePrefix:str = "journal-"
+    IndexFileName:str = "journal.idx"
+
+    folder:str
+    indexPath:str
+    dataName:str = None  # file di dati della prossima aggiunta, scelto alla prima aggiunta dopo un commit
+    sampleRate:int
+
+    nextSeq:int
+    lock:threading.Lock
+
+
+
+    def __init__(self, folder:str, sample_rate:int):
+        os.makedirs(folder, exist_ok=True)
+        self.folder = folder
+        self.indexPath = os.path.join(folder, self.IndexFileName)
+        self.sampleRate = sample_rate
+        self.lock = threading.Lock()
+
+        entries = self.entries()
+        self.nextSeq = entries[-1]["seq"] + 1 if entries else 0
+        self.__repair(entries)
+
+
+
+    def append(self, name:str, track:np.ndarray, startTime:float=None, sampleIndex:int=None):
+        """Accoda una traccia float come PCM_16, ritorna il numero di sequenza nel journal.
+
+        startTime/sampleIndex (ora reale del primo campione e indice di cattura)
+        restano nell'indice, cosi' le tracce recuperate mantengono i tempi reali."""
+        pcm = (np.clip(track, -1.0, 1.0) * 32767).astype('<i2')
+        with self.lock:
+            seq = self.nextSeq
+            if self.dataName is None:
+                self.dataName = f"{self.DataFilePrefix}{seq}.pcm"
+            with open(os.path.join(self.folder, self.dataName), "ab") as f:
+                offset = f.tell()
+                f.write(pcm.tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+
+            entry = {"seq": seq, "name": name, "data": self.dataName, "offset": offset, "frames": len(pcm),
+                     "rate": self.sampleRate, "startTime": startTime, "sampleIndex": sampleIndex}
+            self.__writeIndex(entry)
+
+            self.nextSeq += 1
+        return seq
+
+
+
+    def appendFile(self, name:str, startTime:float=None, sampleIndex:int=None):
+        """Registra una traccia gia' salvata come file (modalita' file): solo la voce dell'indice, niente PCM"""
+        with self.lock:
+            seq = self.nextSeq
+            entry = {"seq": seq, "name": name, "offset": None, "frames": 0, "rate": self.sampleRate,
+                     "startTime": startTime, "sampleIndex": sampleIndex}
+            self.__writeIndex(entry)
+            self.nextSeq += 1
+        return seq
+
+
+
+    def __writeIndex(self, entry:dict):
+        with open(self.indexPath, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+
+
+    def __replaceIndex(self, entries:list):
+        if not entries:
+            if os.path.exists(self.indexPath):
+                os.remove(self.indexPath)
+            return
+        tmpIndex = self.indexPath + ".tmp"
+        with open(tmpIndex, "w", encoding="utf-8") as f:
+            for e in entries:
+                f.write(json.dumps(e) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmpIndex, self.indexPath)
+
+
+
+    def __repair(self, entries:list):
+        """All'avvio: elimina la riga troncata da un crash e i file di dati senza voci che li usino"""
+        if os.path.exists(self.indexPath):
+            with open(self.indexPath, "rb") as f:
+                content = f.read()
+            # Un'ultima riga parziale inghiottirebbe la prossima aggiunta
+            if content and (not content.endswith(b"\n") or content.count(b"\n") != len(entries)):
+                self.__replaceIndex(entries)
+
+        # File liberati da un commit interrotto dopo la sostituzione dell'indice, o scritti da un'aggiunta rimasta senza voce
+        referenced = {self.dataFile(e) for e in entries}
+        for name in os.listdir(self.folder):
+            if name == self.DataFileName or (name.startswith(self.DataFilePrefix) and name.endswith(".pcm")):
+                if name not in referenced:
+                    os.remove(os.path.join(self.folder, name))
+        if os.path.exists(self.indexPath + ".tmp"):
+            os.remove(self.indexPath + ".tmp")
+
+
+
+    def entries(self):
+        if not os.path.exists(self.indexPath):
+            return []
+        entries = []
+        with open(self.indexPath, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entries.append(json.loads(line))
+                except ValueError:
+                    # Ultima riga troncata da un crash: la traccia non era stata registrata per intero
+                    break
+        return entries
+
+
+
+    def dataFile(self, entry:dict):
+        """Nome del file di dati che contiene la traccia (None per le voci in modalita' file)"""
+        if entry["offset"] is None:
+            return None
+        return entry.get("data", self.DataFileName)
+
+
+
+    def read(self, entry:dict):
+        """Rilegge una traccia del journal come float32 (None per le voci in modalita' file)"""
+        if entry["offset"] is None:
+            return None
+        with open(os.path.join(self.folder, self.dataFile(entry)), "rb") as f:
+            f.seek(entry["offset"])
+            pcm = np.frombuffer(f.read(entry["frames"] * 2), dtype='<i2')
+        return pcm.astype(np.float32) / 32767
+
+
+
+    def commit(self, lastSeq:int, firstSeq:int=0):
+        """Toglie le tracce da firstSeq a lastSeq (compresi), tenendo le altre.
+
+        firstSeq permette alla pipeline live di confermare le proprie tracce
+        mentre quelle lasciate dall'esecuzione precedente, sotto di esso, sono
+        ancora in recupero."""
+        with self.lock:
+            entries = self.entries()
+            remaining = [e for e in entries if not firstSeq <= e["seq"] <= lastSeq]
+            if len(remaining) == len(entries):
+                return
+            self.__replaceIndex(remaining)
+            self.dataName = None
+
+            referenced = {self.dataFile(e) for e in remaining}
+            for name in {self.dataFile(e) for e in entries} - referenced - {None}:
+                try:
+                    os.remove(os.path.join(self.folder, name))
+                except FileNotFoundError:
+                    pass
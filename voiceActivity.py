@@ -0,0 +1,64 @@
+import numpy as np
+
+
+
+class VoiceActivityDetector:
+    """Rilevatore di attivita' vocale a energia, vettoriale sui frame del blocco.
+
+    Un frame e' attivo se la sua energia supera di marginDb il rumore di fondo,
+    stimato come percentile basso delle energie e aggiornato lentamente tra un
+    blocco e l'altro. I frame attivi vengono estesi di hangoverMs per non tagliare
+    le code delle parole; il blocco e' silenzioso se la quota di frame attivi e'
+    sotto minSpeechRatio."""
+
+    sampleRate:int
+    frameLength:int
+    marginDb:float
+    minSpeechRatio:float
+    hangoverFrames:int
+    adaptRate:float
+    floorPercentile:float
+
+    noiseFloorDb:float = None
+
+
+
+    def __init__(self, sampleRate:int, frameMs:int=30, marginDb:float=10.0, minSpeechRatio:float=0.03,
+                 hangoverMs:int=300, adaptRate:float=0.1, floorPercentile:float=10):
+        self.sampleRate = sampleRate
+        self.frameLength = max(1, int(sampleRate * frameMs / 1000))
+        self.marginDb = marginDb
+        self.minSpeechRatio = minSpeechRatio
+        self.hangoverFrames = max(0, int(hangoverMs / frameMs))
+        self.adaptRate = adaptRate
+        self.floorPercentile = floorPercentile
+
+
+
+    def frameEnergyDb(self, chunk:np.ndarray):
+        count = len(chunk) // self.frameLength
+        frames = np.asarray(chunk[:count * self.frameLength], dtype=np.float32).reshape(count, self.frameLength)
+        return 10 * np.log10(np.einsum('ij,ij->i', frames, frames) / self.frameLength + 1e-12)
+
+
+
+    def classify(self, chunk:np.ndarray):
+        """Ritorna (parlato:bool, quota di frame attivi, maschera dei frame attivi)"""
+        energy = self.frameEnergyDb(chunk)
+        if len(energy) == 0:
+            return False, 0.0, np.zeros(0, dtype=bool)
+
+        floor = float(np.percentile(energy, self.floorPercentile))
+        if self.noiseFloorDb is None:
+            self.noiseFloorDb = floor
+        else:
+            # Il fondo scende in fretta (stanza che si zittisce) e sale lentamente (parlato continuo)
+            rate = self.adaptRate if floor > self.noiseFloorDb else 0.5
+            self.noiseFloorDb += rate * (floor - self.noiseFloorDb)
+
+        active = energy > self.noiseFloorDb + self.marginDb
+        if self.hangoverFrames and active.any():
+            active = np.convolve(active, np.ones(self.hangoverFrames + 1), mode="full")[:len(active)] > 0
+
+        ratio = float(active.mean())
+        return ratio >= self.minSpeechRatio, ratio, active